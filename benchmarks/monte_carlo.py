@@ -0,0 +1,46 @@
+"""
+Measures the time taken to simulate many random paths of a student loan over a 30 year horizon.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.monte_carlo [num_paths]
+"""
+
+import sys
+import time
+from datetime import date
+
+from utils.loan import simulate_repayment_monte_carlo
+
+REPEATS = 3
+
+# Salaries at which the loan is written off, partly repaid and quickly repaid
+SALARIES = [30_000, 60_000, 150_000]
+
+
+if __name__ == "__main__":
+    num_paths = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    as_of = date(2025, 4, 6)
+    kwargs = dict(
+        salary_growth=0.04,
+        loan=60_000,
+        graduation_year=as_of.year - 1,
+        interest_rate=0.07,
+        salary_sacrifice=0.05,
+        num_paths=num_paths,
+        seed=0,
+        as_of=as_of,
+    )
+
+    print(f"{num_paths:,} paths, best of {REPEATS}")
+    for initial_salary in SALARIES:
+        times = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            result = simulate_repayment_monte_carlo(initial_salary, **kwargs)
+            times.append(time.perf_counter() - start)
+        print(
+            f"£{initial_salary:>7,}: {min(times) * 1e3:7.1f} ms, "
+            f"{len(result['period'])} months, "
+            f"write-off probability {result['write-off probability']:.1%}"
+        )
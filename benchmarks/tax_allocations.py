@@ -0,0 +1,67 @@
+"""
+Compares the time and peak memory of the tax functions with and without `out` and a workspace.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.tax_allocations
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils.loan import student_loan_repayment
+from utils.schedule import Workspace
+from utils.tax import income_tax, monthly, national_insurance
+
+ROWS = 10_000_000
+REPEATS = 5
+
+
+def allocating(gross_income_monthly: np.ndarray):
+    monthly(income_tax, gross_income_monthly)
+    monthly(national_insurance, gross_income_monthly)
+    monthly(student_loan_repayment, gross_income_monthly, "Plan 2")
+
+
+def preallocated(
+    gross_income_monthly: np.ndarray, out: np.ndarray, workspace: Workspace
+):
+    monthly(income_tax, gross_income_monthly, out=out[0], workspace=workspace)
+    monthly(national_insurance, gross_income_monthly, out=out[1], workspace=workspace)
+    monthly(
+        student_loan_repayment,
+        gross_income_monthly,
+        "Plan 2",
+        out=out[2],
+        workspace=workspace,
+    )
+
+
+def measure(func: callable, *args: list) -> tuple[float, float]:
+    """Returns the best time in seconds and the peak traced memory in MiB of repeated calls."""
+    func(*args)
+    times = []
+    tracemalloc.start()
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak / 2**20
+
+
+if __name__ == "__main__":
+    gross_income_monthly = np.random.default_rng(0).uniform(0, 15_000, ROWS)
+    out = np.empty((3, ROWS))
+    workspace = Workspace()
+
+    results = {
+        "allocating": measure(allocating, gross_income_monthly),
+        "out + workspace": measure(preallocated, gross_income_monthly, out, workspace),
+    }
+    print(f"{ROWS:,} rows, best of {REPEATS}")
+    for name, (seconds, peak) in results.items():
+        print(f"{name:>16}: {seconds * 1e3:8.1f} ms, peak {peak:8.1f} MiB")
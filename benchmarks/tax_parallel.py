@@ -0,0 +1,50 @@
+"""
+Measures how the evaluation of the tax functions scales with the number of worker threads.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.tax_parallel [max_workers]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from utils.loan import student_loan_repayment
+from utils.tax import income_tax, national_insurance, parallel
+
+ROWS = 50_000_000
+REPEATS = 3
+
+
+def evaluate(gross_income: np.ndarray, out: np.ndarray, workers: int):
+    parallel(income_tax, gross_income, workers=workers, out=out[0])
+    parallel(national_insurance, gross_income, workers=workers, out=out[1])
+    parallel(
+        student_loan_repayment, gross_income, "Plan 2", workers=workers, out=out[2]
+    )
+
+
+if __name__ == "__main__":
+    gross_income = np.random.default_rng(0).uniform(0, 200_000, ROWS)
+    out = np.empty((3, ROWS))
+
+    print(f"{ROWS:,} rows, best of {REPEATS}")
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    workers = 1
+    while workers <= max_workers:
+        evaluate(gross_income, out, workers)
+        times = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            evaluate(gross_income, out, workers)
+            times.append(time.perf_counter() - start)
+        if workers == 1:
+            baseline = min(times)
+        print(
+            f"{workers:>3} workers: {min(times) * 1e3:8.1f} ms, "
+            f"speedup {baseline / min(times):4.2f}x"
+        )
+        workers *= 2
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+class DiskCache:
+    """
+    A size-bounded cache of arrays on disk, which can be shared between processes.
+
+    Each entry is a dictionary of arrays stored as a compressed `.npz` file named after its key.
+    Reading an entry updates its modification time, so when the total size of the files exceeds
+    `max_bytes` the least recently used entries are evicted first.
+
+    Attributes:
+        directory (Path): The directory that the entries are stored in.
+        max_bytes (int): The maximum total size of the entries.
+        hits (int): The number of lookups that found an entry.
+        misses (int): The number of lookups that did not find an entry.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = 256 * 2**20):
+        """
+        Parameters:
+        directory (str | Path): The directory to store the entries in, which is created if it does not exist.
+        max_bytes (int, optional): The maximum total size of the entries. Defaults to 256 MiB.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        """
+        Finds the file that an entry is stored in.
+
+        Parameters:
+        key (str): The key of the entry, which must be a valid file name, e.g. a hash.
+
+        Returns:
+        Path: The path of the file, which may not exist.
+        """
+        return self.directory / f"{key}.npz"
+
+    def get(self, key: str) -> dict[str, np.ndarray] | None:
+        """
+        Looks up an entry.
+
+        Parameters:
+        key (str): The key of the entry.
+
+        Returns:
+        dict[str, np.ndarray] | None: The arrays of the entry, or None if there is no entry.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as entry:
+                arrays = dict(entry)
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return arrays
+
+    def put(self, key: str, arrays: dict[str, np.ndarray]) -> None:
+        """
+        Stores an entry, replacing any with the same key, then evicts entries until the cache fits
+        in `max_bytes`.
+
+        The entry is written to a temporary file and then renamed, so that other processes never
+        read a partially written entry.
+
+        Parameters:
+        key (str): The key of the entry.
+        arrays (dict[str, np.ndarray]): The arrays to store, which must not be object arrays.
+        """
+        file, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        with os.fdopen(file, "wb") as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(temporary, self.path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for path in self.directory.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(size for _, size, _ in entries)
+        for _, size_, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= size_
+
+    def clear(self) -> None:
+        """Removes every entry and resets the hit and miss counters."""
+        for path in self.directory.glob("*.npz"):
+            path.unlink(missing_ok=True)
+        self.hits = self.misses = 0
@@ -1,27 +1,71 @@
-from calendar import isleap, monthrange
+import hashlib
 from datetime import date
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
 
-from utils.tax import income_tax, monthly, national_insurance, tax
+from utils.cache import DiskCache
+from utils.rules import (
+    TaxYear,
+    get_tax_year,
+    get_tax_years,
+    rules_hash,
+    rules_version,
+)
+from utils.schedule import Workspace
+from utils.tax import monthly, tax
 
-PLANS = {
-    "Plan 1": {"threshold": 22_015, "percentage": 0.09},
-    "Plan 2": {"threshold": 27_295, "percentage": 0.09},
-    "Plan 4": {"threshold": 27_660, "percentage": 0.09},
-    "Plan 5": {"threshold": 25_000, "percentage": 0.09},
-    "Postgraduate": {"threshold": 21_000, "percentage": 0.06},
-}
+# Student loan repayment plans of the current tax year
+PLANS = get_tax_year().student_loan_plans
 
+# Batches with at most this many distinct interest rates look their rates up in the cache
+# of `monthly_interest_rates`, larger batches calculate them all at once
+CACHED_INTEREST_RATES = 256
 
-def student_loan_repayment(gross_income: float, plan: str):
+# The month that student loan interest rates change in every year, with RPI
+INTEREST_RATE_MONTH = 9
+
+# The month that repayment thresholds change in every year, at the start of the tax year
+THRESHOLD_MONTH = 4
+
+# Number of months in the first block simulated when trimming, each block is twice the last
+TRIM_BLOCK_SIZE = 24
+
+# Smaller batches are simulated in a single block when trimming, since the overhead of each
+# block outweighs the months saved
+TRIM_MIN_SCENARIOS = 64
+
+# The passive mode only repays from the salary, the active mode also makes the instant and
+# extra repayments
+MODES = ["passive", "active"]
+
+COLUMNS = [
+    "gross",
+    "net",
+    "loan",
+    "interest",
+    "salary repayment",
+    "extra repayment",
+]
+
+
+def student_loan_repayment(
+    gross_income: float,
+    plan: str,
+    year: int = None,
+    out: np.ndarray = None,
+    workspace: Workspace = None,
+):
     """
     Calculates the student loan repayment amount based on the provided income and repayment plan.
 
     Parameters:
     gross_income (float): The gross income of the student.
     plan (str): The repayment plan of the student. It must be one of the following: "Plan 1", "Plan 2", "Plan 4", "Plan 5", "Postgraduate".
+    year (int, optional): The tax year whose rules are used, see `utils.rules.get_tax_year`. Defaults to the current tax year.
+    out (np.ndarray, optional): The array to write the repayment into, see `Schedule.__call__`. Defaults to None.
+    workspace (Workspace, optional): The scratch arrays to use when writing into `out`. Defaults to None.
 
     Returns:
     float: The loan repayment amount.
@@ -29,8 +73,653 @@ def student_loan_repayment(gross_income: float, plan: str):
     Raises:
     AssertionError: If the provided plan does not exist in the predetermined plans.
     """
-    assert plan in PLANS, f"`plan` must be one of: {list(PLANS.keys())}"
-    return tax(gross_income, PLANS[plan]["percentage"], PLANS[plan]["threshold"])
+    schedule = get_tax_year(year).student_loan_schedule(plan)
+    return schedule(gross_income, out=out, workspace=workspace)
+
+
+def month_range(start_date: date, end_date: date) -> np.ndarray:
+    """
+    Creates the months whose last day falls between the start and end dates.
+
+    Parameters:
+    start_date (date): The first date of the range.
+    end_date (date): The last date of the range. Its month is excluded unless it is the last day of the month.
+
+    Returns:
+    np.ndarray: The months as an array of `datetime64[M]`.
+    """
+    end_month = np.datetime64(end_date, "M")
+    if (end_month + 1).astype("datetime64[D]") - 1 <= np.datetime64(end_date):
+        end_month += 1
+    return np.arange(np.datetime64(start_date, "M"), end_month)
+
+
+def days_in_year_fraction(months: np.ndarray) -> np.ndarray:
+    """
+    Calculates the fraction of its year that each month makes up, accounting for leap years.
+
+    Parameters:
+    months (np.ndarray): The months as an array of `datetime64[M]`.
+
+    Returns:
+    np.ndarray: The number of days in each month divided by the number of days in its year.
+    """
+    days_in_month = ((months + 1).astype("datetime64[D]") - months).astype(int)
+    years = months.astype("datetime64[Y]")
+    days_in_year = ((years + 1).astype("datetime64[D]") - years).astype(int)
+    return days_in_month / days_in_year
+
+
+@lru_cache(maxsize=1024)
+def _year_fraction(start_month: int, num_months: int) -> np.ndarray:
+    months = np.arange(start_month, start_month + num_months).astype("datetime64[M]")
+    fraction = days_in_year_fraction(months)
+    fraction.setflags(write=False)
+    return fraction
+
+
+@lru_cache(maxsize=4096)
+def monthly_interest_rates(
+    start_month: int, num_months: int, interest_rate: float
+) -> np.ndarray:
+    """
+    Calculates the interest rate applied in each month, pro-rated by the number of days in that month.
+
+    The rates only depend on the calendar and the annual rate, so they are cached and shared by
+    every simulation over the same months. The returned array is read-only.
+
+    Parameters:
+    start_month (int): The first month, as a number of months since January 1970.
+    num_months (int): The number of months.
+    interest_rate (float): The annual interest rate.
+
+    Returns:
+    np.ndarray: The interest rate of each month.
+    """
+    rates = (1 + interest_rate) ** _year_fraction(start_month, num_months) - 1
+    rates.setflags(write=False)
+    return rates
+
+
+def month_end(months: np.ndarray) -> np.ndarray:
+    """
+    Finds the last day of each month.
+
+    Parameters:
+    months (np.ndarray): The months as an array of `datetime64[M]`.
+
+    Returns:
+    np.ndarray: The last day of each month as an array of `datetime64[D]`.
+    """
+    return (months + 1).astype("datetime64[D]") - 1
+
+
+def monthly_schedule(
+    schedule: float | np.ndarray | dict[int, float],
+    months: np.ndarray,
+    first_month: int,
+) -> np.ndarray:
+    """
+    Expands a schedule of values, such as interest rates, to the value in effect in each month.
+
+    Parameters:
+    schedule (float | np.ndarray | dict[int, float]): A constant value, an array with the value of each month (whose last value continues after it ends) or a dictionary mapping each year to the value that takes effect in `first_month` of that year. Years before the first in the dictionary use its first value and years after the last use its last value.
+    months (np.ndarray): The months as an array of `datetime64[M]`.
+    first_month (int): The month of the year that the values of a dictionary take effect in, e.g. 9 for September.
+
+    Returns:
+    np.ndarray: The value of each month, with months along the last axis.
+    """
+    if isinstance(schedule, dict):
+        years = np.array(sorted(schedule))
+        values = np.array([schedule[year] for year in years], dtype=float)
+        year = months.astype("datetime64[Y]").astype(int) + 1970
+        year -= months.astype(int) % 12 < first_month - 1
+        return values[np.maximum(np.searchsorted(years, year, side="right") - 1, 0)]
+    schedule = np.asarray(schedule, dtype=float)
+    if schedule.ndim == 0:
+        return np.full(len(months), schedule)
+    return schedule[..., np.minimum(np.arange(len(months)), schedule.shape[-1] - 1)]
+
+
+def _tax_year_rules(months: np.ndarray) -> tuple[list[TaxYear], np.ndarray]:
+    """
+    Looks up the rules that apply in each month.
+
+    Parameters:
+    months (np.ndarray): The months as an array of `datetime64[M]`, which may be empty.
+
+    Returns:
+    tuple[list[TaxYear], np.ndarray]: The distinct rules that apply, which are those of the current tax year if there are no months, and the index of the rules that apply in each month.
+    """
+    if not len(months):
+        # There is nothing to repay in a single month horizon, but the plans are still looked up
+        return [get_tax_year()], np.zeros(0, dtype=int)
+
+    # Tax years start on 6 April, so a month belongs to the tax year that its last day is in
+    tax_year = months.astype("datetime64[Y]").astype(int) + 1970
+    tax_year -= months.astype(int) % 12 < 3
+    tax_years = get_tax_years(int(tax_year.min()), int(tax_year.max()) + 1)
+
+    rules = list({id(rules): rules for rules in tax_years}.values())
+    index = np.array([rules.index(rules_) for rules_ in tax_years])
+    return rules, index[tax_year - tax_year.min()]
+
+
+def _plan_terms(
+    plan: np.ndarray, rules: list[TaxYear]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Looks up the repayment percentage and threshold for an array of repayment plans.
+
+    Parameters:
+    plan (np.ndarray): The repayment plan of each scenario.
+    rules (list[TaxYear]): The rules to look the plans up in.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: The percentage and threshold of each scenario (rows) in each of the rules (columns).
+
+    Raises:
+    AssertionError: If any of the provided plans do not exist in the rules.
+    """
+    names, inverse = np.unique(plan, return_inverse=True)
+    plans = [rules_.student_loan_plans for rules_ in rules]
+    for name in names:
+        for plans_ in plans:
+            assert name in plans_, f"`plan` must be one of: {list(plans_.keys())}"
+    percentage = np.array([[p[name]["percentage"] for p in plans] for name in names])
+    threshold = np.array([[p[name]["threshold"] for p in plans] for name in names])
+    inverse = inverse.reshape(plan.shape)
+    return percentage[inverse], threshold[inverse]
+
+
+def _amortise(
+    initial_loan: np.ndarray,
+    monthly_interest_rate: np.ndarray,
+    salary_repayment: np.ndarray,
+    extra_repayment: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates the loan balance and interest for every scenario and month.
+
+    The balance follows `loan[i] = loan[i - 1] * (1 + rate[i - 1]) - repayment[i - 1]`,
+    which is evaluated with cumulative products and sums instead of a loop. Once the balance
+    would become negative the loan is paid off, so the final repayment is reduced to what was
+    owed and every repayment after it is zeroed. The repayment arrays are updated in place.
+
+    Parameters:
+    initial_loan (np.ndarray): The loan balance of each scenario in the first month.
+    monthly_interest_rate (np.ndarray): The interest rate applied in each scenario and month.
+    salary_repayment (np.ndarray): The repayment from the salary in each scenario and month.
+    extra_repayment (np.ndarray): The additional repayment in each scenario and month.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: The loan balance and the interest accrued in each scenario and month.
+    """
+    num_scenarios, num_periods = salary_repayment.shape
+
+    # Unclamped balance, using the growth of £1 borrowed at the start of the simulation
+    growth = np.ones((num_scenarios, num_periods))
+    np.cumprod(1 + monthly_interest_rate[:, :-1], axis=1, out=growth[:, 1:])
+    loan = np.zeros((num_scenarios, num_periods))
+    repayment = salary_repayment[:, :-1] + extra_repayment[:, :-1]
+    np.cumsum(repayment / growth[:, 1:], axis=1, out=loan[:, 1:])
+    np.subtract(initial_loan[:, None], loan, out=loan)
+    loan *= growth
+
+    # Find the month that each loan is paid off in, if it ever is
+    paid_off = loan < 0
+    i = np.where(paid_off.any(axis=1), paid_off.argmax(axis=1), num_periods)
+    paid_off = np.arange(num_periods) >= i[:, None]
+    loan[paid_off] = 0
+    salary_repayment[paid_off] = 0
+    extra_repayment[paid_off] = 0
+    interest = np.zeros((num_scenarios, num_periods))
+    np.multiply(loan[:, :-1], monthly_interest_rate[:, :-1], out=interest[:, :-1])
+
+    # The final repayment only covers what remains of the loan
+    scenarios = np.flatnonzero(i < num_periods)
+    i = i[scenarios] - 1
+    remaining = loan[scenarios, i] + interest[scenarios, i]
+    remaining -= salary_repayment[scenarios, i]
+    salary_repayment[scenarios, i] += np.minimum(remaining, 0)
+    extra_repayment[scenarios, i] = np.maximum(remaining, 0)
+    return loan, interest
+
+
+def _simulate(
+    months: np.ndarray,
+    initial_salary: np.ndarray,
+    salary_growth: np.ndarray,
+    loan: np.ndarray,
+    interest_rate: np.ndarray,
+    salary_sacrifice: np.ndarray,
+    plan: np.ndarray,
+    instant_repayment: np.ndarray,
+    extra_repayment: np.ndarray,
+    repayment_threshold: np.ndarray = None,
+    trim: bool = False,
+) -> dict[str, np.ndarray]:
+    """
+    Simulates the repayment of a batch of student loans over the given months.
+
+    All parameters except `months`, `extra_repayment` and `trim` are 1D arrays with one element per
+    scenario. `extra_repayment` is a 2D array of shape (scenarios, months) and is updated in place.
+    `salary_growth` and `interest_rate` can instead be 2D arrays of shape (scenarios, months), in
+    which case the salary grows at the end of each December by the growth of that month and the
+    interest rate of each month is the annual rate of that month. `interest_rate` can also have a
+    single row shared by all scenarios. `repayment_threshold`, if given, is an array that
+    broadcasts to (scenarios, months) of the annual repayment threshold of each month, which
+    replaces the thresholds of the plans.
+
+    If `trim` is True, the results end at the month the last loan was repaid in. Batches of at
+    least `TRIM_MIN_SCENARIOS` are then simulated in blocks of increasing size, and the simulation
+    stops once every loan has been repaid.
+
+    Returns:
+    dict[str, np.ndarray]: A 2D array of shape (scenarios, months) for each of `COLUMNS`.
+    """
+    num_scenarios, num_periods = extra_repayment.shape
+
+    # Gross monthly income, which grows at the end of every December
+    december = months[:-1].astype(int) % 12 == 11
+    gross = np.empty((num_scenarios, num_periods))
+    gross[:, 0] = initial_salary / 12
+    if salary_growth.ndim == 1:
+        salary_growth = salary_growth[:, None]
+    else:
+        salary_growth = salary_growth[:, :-1]
+    gross[:, 1:] = np.where(december, 1 + salary_growth, 1)
+    np.cumprod(gross, axis=1, out=gross)
+
+    # Thresholds for each month, since they can change every tax year
+    rules, rules_index = _tax_year_rules(months[:-1])
+    percentage, threshold = _plan_terms(plan, rules)
+    if repayment_threshold is not None:
+        repayment_threshold = np.broadcast_to(
+            repayment_threshold, (num_scenarios, num_periods)
+        )
+
+    # Interest rate for each month, pro-rated by the number of days in that month
+    start_month = int(months[0].astype(int))
+    if interest_rate.ndim == 2:
+        monthly_interest_rate = np.log1p(interest_rate)
+        monthly_interest_rate *= _year_fraction(start_month, num_periods)
+        np.expm1(monthly_interest_rate, out=monthly_interest_rate)
+        monthly_interest_rate = np.broadcast_to(
+            monthly_interest_rate, (num_scenarios, num_periods)
+        )
+        inverse = slice(None)
+    else:
+        rates, inverse = np.unique(interest_rate, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if len(rates) <= CACHED_INTEREST_RATES:
+            monthly_interest_rate = np.stack(
+                [
+                    monthly_interest_rates(start_month, num_periods, float(r))
+                    for r in rates
+                ]
+            )
+        else:
+            monthly_interest_rate = (1 + rates[:, None]) ** _year_fraction(
+                start_month, num_periods
+            ) - 1
+
+    salary_repayment = np.zeros((num_scenarios, num_periods))
+    net = np.zeros((num_scenarios, num_periods))
+    interest = np.zeros((num_scenarios, num_periods))
+    loan_ = np.zeros((num_scenarios, num_periods))
+    loan_[:, 0] = loan - np.minimum(instant_repayment, loan)
+
+    def repay_from_salary(start: int, stop: int):
+        # Each month is repaid from the following month's salary after salary sacrifice
+        sacrificed = gross[:, start + 1 : stop + 1] * (1 - salary_sacrifice[:, None])
+        index = rules_index[start:stop]
+        if len(rules) == 1:
+            percentage_, threshold_ = percentage, threshold
+        else:
+            percentage_, threshold_ = percentage[:, index], threshold[:, index]
+        if repayment_threshold is not None:
+            threshold_ = repayment_threshold[:, start:stop]
+        salary_repayment[:, start:stop] = monthly(
+            tax, sacrificed, percentage_, threshold_
+        )
+        net[:, start:stop] = sacrificed
+        for i, rules_ in enumerate(rules):
+            columns = index == i if len(rules) > 1 else slice(None)
+            net[:, start:stop][:, columns] -= monthly(
+                rules_.taxes_schedule, sacrificed[:, columns]
+            )
+
+    start, block = 0, num_periods
+    if trim and num_scenarios >= TRIM_MIN_SCENARIOS:
+        start, block = 0, TRIM_BLOCK_SIZE
+    while start < num_periods - 1:
+        if trim and not loan_[:, start].any():
+            # Every loan has been repaid, so only the net income of this month remains
+            repay_from_salary(start, start + 1)
+            salary_repayment[:, start] = extra_repayment[:, start] = 0
+            break
+        stop = min(start + block, num_periods - 1)
+        repay_from_salary(start, stop)
+        window = slice(start, stop + 1)
+        loan_[:, window], interest[:, window] = _amortise(
+            loan_[:, start],
+            monthly_interest_rate[:, window][inverse],
+            salary_repayment[:, window],
+            extra_repayment[:, window],
+        )
+        # Net income after tax and repayments
+        net[:, start:stop] -= salary_repayment[:, start:stop]
+        net[:, start:stop] -= extra_repayment[:, start:stop]
+        start, block = stop, block * 2
+
+    values = (gross, net, loan_, interest, salary_repayment, extra_repayment)
+    if trim and not loan_[:, -1].any():
+        # End at the month that the last loan was repaid in
+        num_periods = (loan_ != 0).sum(axis=1).max() + 1
+        values = [value[:, :num_periods] for value in values]
+    return dict(zip(COLUMNS, values))
+
+
+def _hashable(value) -> object:
+    """
+    Converts an input to a simulation into a value whose `repr` identifies its contents exactly.
+
+    Parameters:
+    value: The input, which can be None, a string, a date, a dictionary or anything that
+        `np.asarray` converts to an array of numbers or strings, such as a `pd.Series`.
+
+    Returns:
+    object: A tuple of the dtype, shape and bytes of array-likes, a sorted tuple of the items
+        of dictionaries, or the value itself for None, strings and dates.
+
+    Raises:
+    TypeError: If the value is of any other type, since its `repr` may not identify it exactly.
+    """
+    if value is None or isinstance(value, (str, date)):
+        return value
+    if isinstance(value, dict):
+        return tuple(sorted((_hashable(k), _hashable(v)) for k, v in value.items()))
+    array = np.asarray(value)
+    if array.dtype.kind in "biuf":
+        array = array.astype(float)
+    elif array.dtype.kind not in "SU":
+        raise TypeError(f"Cannot hash an input of type {type(value).__name__}")
+    return (array.dtype.str, array.shape, array.tobytes())
+
+
+def input_hash(**inputs) -> str:
+    """
+    Calculates a hash of the contents of the inputs to a simulation, which only changes if they do.
+
+    Numbers and array-likes are hashed by their values as floats, so e.g. 1 and 1.0 hash the same,
+    and dictionaries are hashed independently of their order, see `_hashable`.
+
+    Parameters:
+    **inputs: The inputs, by name.
+
+    Returns:
+    str: The hexadecimal SHA-256 hash of the inputs.
+
+    Raises:
+    TypeError: If an input is not of a type that `_hashable` supports.
+    """
+    digest = hashlib.sha256()
+    for name, value in sorted(inputs.items()):
+        digest.update(f"{name}={_hashable(value)!r};".encode())
+    return digest.hexdigest()
+
+
+def _simulate_scenario(
+    months: np.ndarray,
+    initial_salary: float,
+    salary_growth: float,
+    loan: float,
+    interest_rate: float | tuple[float, ...],
+    salary_sacrifice: float,
+    plan: str,
+    instant_repayment: float,
+    extra_repayment: np.ndarray,
+    repayment_threshold: tuple[float, ...] | None,
+) -> dict[str, np.ndarray]:
+    """
+    Simulates a single scenario with `_simulate`, stopping once the loan has been repaid.
+
+    `interest_rate` and `repayment_threshold` can be tuples with the value of each month.
+
+    Returns:
+    dict[str, np.ndarray]: The results of `_simulate` for the scenario.
+    """
+    inputs = np.broadcast_arrays(
+        initial_salary, salary_growth, loan, salary_sacrifice, plan, instant_repayment
+    )
+    initial_salary, salary_growth, loan, salary_sacrifice, plan, instant_repayment = (
+        map(np.atleast_1d, inputs)
+    )
+    # Schedules have one row shared by every scenario
+    interest_rate = np.atleast_1d(interest_rate)
+    if len(interest_rate) > 1:
+        interest_rate = interest_rate[None]
+    if repayment_threshold is not None:
+        repayment_threshold = np.array(repayment_threshold)
+    return _simulate(
+        months,
+        initial_salary,
+        salary_growth,
+        loan,
+        interest_rate,
+        salary_sacrifice,
+        plan,
+        instant_repayment,
+        extra_repayment,
+        repayment_threshold,
+        trim=True,
+    )
+
+
+@lru_cache(maxsize=256)
+def _simulate_passive(
+    start_month: int,
+    num_months: int,
+    initial_salary: float,
+    salary_growth: float,
+    loan: float,
+    interest_rate: float | tuple[float, ...],
+    salary_sacrifice: float,
+    plan: str,
+    repayment_threshold: tuple[float, ...] | None,
+    version: int,
+) -> dict[str, np.ndarray]:
+    """
+    Simulates the passive mode, which only depends on these parameters, so that it is not
+    simulated again when only the instant or extra repayments change. `interest_rate` and
+    `repayment_threshold` can be tuples with the value of each month, so that they can be hashed.
+
+    `version` is the `rules_version` that the simulation uses, so that registering new rules
+    invalidates the cache. The returned arrays are read-only.
+
+    Returns:
+    dict[str, np.ndarray]: The results of `_simulate` for a single scenario.
+    """
+    months = np.arange(start_month, start_month + num_months).astype("datetime64[M]")
+    data = _simulate_scenario(
+        months,
+        initial_salary,
+        salary_growth,
+        loan,
+        interest_rate,
+        salary_sacrifice,
+        plan,
+        0,
+        np.zeros((1, num_months)),
+        repayment_threshold,
+    )
+    for value in data.values():
+        value.setflags(write=False)
+    return data
+
+
+def _join_modes(*modes: dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Joins the results of `_simulate` for each mode, which may end at different months.
+
+    Once a loan has been repaid, the gross income is the same as that of the modes still repaying
+    and the net income is the same as theirs without the repayments.
+
+    Returns:
+    np.ndarray: The results as a (mode, column, month) block, ending at the last month of any mode.
+    """
+    longest = max(modes, key=lambda data: data["loan"].shape[1])
+    num_periods = longest["loan"].shape[1]
+    block = np.zeros((len(modes), len(COLUMNS), num_periods))
+    for joined, data in zip(block, modes):
+        n = data["loan"].shape[1]
+        joined[:, :n] = [data[column][0] for column in COLUMNS]
+        gross, net = joined[COLUMNS.index("gross")], joined[COLUMNS.index("net")]
+        gross[n:] = longest["gross"][0, n:]
+        net[n:] = longest["net"][0, n:]
+        net[n:] += longest["salary repayment"][0, n:]
+        net[n:] += longest["extra repayment"][0, n:]
+    return block
+
+
+def _simulate_modes(
+    initial_salary: float,
+    salary_growth: float,
+    loan: float,
+    graduation_year: int,
+    interest_rate: float | np.ndarray | dict[int, float],
+    salary_sacrifice: float,
+    plan: str,
+    instant_repayment: float,
+    extra_repayments: float | dict[int:float],
+    repayment_threshold: float | np.ndarray | dict[int, float],
+    as_of: date,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Simulates each of `MODES` for the parameters of `simulate_repayment`.
+
+    The passive mode is cached by `_simulate_passive`, so only the active mode is simulated when
+    just the repayments change.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: The months simulated, and the (mode, column, month) block of results, see `_join_modes`.
+    """
+    end_date = date(graduation_year + 31, 4, 1)
+    months = month_range(as_of, end_date)
+
+    extra_repayment = np.zeros((1, len(months)))
+    if extra_repayments:
+        if isinstance(extra_repayments, float):
+            extra_repayment[0] = extra_repayments
+        else:
+            for k, v in extra_repayments.items():
+                if k < len(months):
+                    extra_repayment[0, k] = v
+
+    # Schedules are expanded to the value of each month, constant interest rates are not so
+    # that their monthly rates can be cached
+    if np.ndim(interest_rate) or isinstance(interest_rate, dict):
+        interest_rate = tuple(
+            monthly_schedule(interest_rate, months, INTEREST_RATE_MONTH)
+        )
+    else:
+        interest_rate = float(interest_rate)
+    if repayment_threshold is not None:
+        repayment_threshold = tuple(
+            monthly_schedule(repayment_threshold, months, THRESHOLD_MONTH)
+        )
+
+    # Only simulate the periods where the loan is being repaid
+    passive = _simulate_passive(
+        int(months[0].astype(int)),
+        len(months),
+        float(initial_salary),
+        float(salary_growth),
+        float(loan),
+        interest_rate,
+        float(salary_sacrifice),
+        plan,
+        repayment_threshold,
+        rules_version(),
+    )
+    active = _simulate_scenario(
+        months,
+        initial_salary,
+        salary_growth,
+        loan,
+        interest_rate,
+        salary_sacrifice,
+        plan,
+        instant_repayment or 0,
+        extra_repayment,
+        repayment_threshold,
+    )
+    return months, _join_modes(passive, active)
+
+
+class RepaymentResult:
+    """
+    The results of `simulate_repayment`, stored as a single (mode, column, month) block.
+
+    Columns are accessed by name, with or without a mode, as views of the block, e.g.
+    `result["loan active"]` is the active loan balance of each month and `result["loan"]` is the
+    (mode, month) array of both. The DataFrame of every column is only built when `to_frame` is
+    called.
+
+    Attributes:
+        values (np.ndarray): The (mode, column, month) block of results, in the order of `MODES` and `COLUMNS`.
+        period (np.ndarray): The last day of each month as an array of `datetime64[D]`.
+        input_hash (str): The `input_hash` of the parameters that produced the results.
+    """
+
+    def __init__(self, values: np.ndarray, period: np.ndarray, input_hash: str):
+        """
+        Parameters:
+        values (np.ndarray): The (mode, column, month) block of results.
+        period (np.ndarray): The last day of each month.
+        input_hash (str): The `input_hash` of the parameters that produced the results.
+        """
+        self.values = values
+        self.period = period
+        self.input_hash = input_hash
+        self._frame = None
+
+    @property
+    def columns(self) -> list[str]:
+        """The name of every column of each mode, in the order of `to_frame`."""
+        return [f"{column} {mode}" for mode in MODES for column in COLUMNS]
+
+    def __len__(self) -> int:
+        return len(self.period)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        if column in COLUMNS:
+            return self.values[:, COLUMNS.index(column)]
+        name, _, mode = column.rpartition(" ")
+        assert (
+            mode in MODES and name in COLUMNS
+        ), f"`column` must be one of: {self.columns}"
+        return self.values[MODES.index(mode), COLUMNS.index(name)]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Converts the results to a DataFrame, which is only built once.
+
+        Returns:
+        pd.DataFrame: The results, indexed by the last day of each month, with one column for every
+            column of each mode, e.g. "loan active", and the `input_hash` in `attrs["input hash"]`.
+        """
+        if self._frame is None:
+            # Both modes share the same periods, so they can be placed side by side
+            self._frame = pd.DataFrame(
+                self.values.reshape(-1, len(self)).T,
+                index=pd.DatetimeIndex(self.period),
+                columns=self.columns,
+            )
+            self._frame.attrs["input hash"] = self.input_hash
+        return self._frame
 
 
 def simulate_repayment(
@@ -38,12 +727,15 @@ def simulate_repayment(
     salary_growth: float,
     loan: float,
     graduation_year: int,
-    interest_rate: float,
+    interest_rate: float | np.ndarray | dict[int, float],
     salary_sacrifice: float,
     plan: str = "Plan 2",
     instant_repayment: float = None,
     extra_repayments: float | dict[int:float] = None,
-) -> pd.DataFrame:
+    repayment_threshold: float | np.ndarray | dict[int, float] = None,
+    as_of: date = None,
+    cache: DiskCache = None,
+) -> "RepaymentResult":
     """
     Simulates the repayment of a student loan.
 
@@ -52,14 +744,19 @@ def simulate_repayment(
     salary_growth (float): The annual growth rate of the salary.
     loan (float): The initial amount of the loan.
     graduation_year (int): The year of graduation.
-    interest_rate (float): The annual interest rate of the loan.
+    interest_rate (float | np.ndarray | dict[int, float]): The annual interest rate of the loan. Can be a constant rate, an array with the rate of each month or a dictionary mapping from year to the rate from September of that year, see `monthly_schedule`.
     salary_sacrifice (float): The proportion of the salary to be sacrificed to things such as pension contributions.
     plan (str): The repayment plan. Default is "Plan 2".
     instant_repayment (float): Additional repayment to be made immediately.
     extra_repayments (float | dict[int:float]): Additional repayments to be made. Can be a constant amount (float) or a dictionary mapping from month number to repayment amount.
+    repayment_threshold (float | np.ndarray | dict[int, float]): The annual income above which the loan is repaid, replacing the threshold of the plan in the tax rules. Can be a constant threshold, an array with the threshold of each month or a dictionary mapping from year to the threshold from April of that year, see `monthly_schedule`. Default is None, for the thresholds in the tax rules.
+    as_of (date): The date that the simulation starts from. Default is today.
+    cache (DiskCache): The cache to look the results up in, and store them in if they are not found. The results are keyed by the `input_hash` of the parameters and the `rules_hash` of the tax rules. Default is None, for no cache.
 
     Returns:
-    pandas.DataFrame: A dataframe containing the simulation results. The columns are:
+    RepaymentResult: The simulation results of each of `MODES`. Each column can be accessed as an
+        array, e.g. `result["loan active"]`, or all of them as a DataFrame with `result.to_frame()`.
+        The columns are:
         - "gross": Gross monthly income.
         - "net": Net monthly income after tax and loan repayments.
         - "loan": Remaining loan balance.
@@ -67,103 +764,431 @@ def simulate_repayment(
         - "salary repayment": Repayment amount from the salary in the current month.
         - "extra repayment": Additional repayment amount in the current month.
     """
-    start_date = date.today()
+    inputs = dict(
+        initial_salary=initial_salary,
+        salary_growth=salary_growth,
+        loan=loan,
+        graduation_year=graduation_year,
+        interest_rate=interest_rate,
+        salary_sacrifice=salary_sacrifice,
+        plan=plan,
+        instant_repayment=instant_repayment,
+        extra_repayments=extra_repayments,
+        repayment_threshold=repayment_threshold,
+        as_of=as_of or date.today(),
+    )
+    hash_ = input_hash(**inputs)
+    key = f"{hash_}-{rules_hash()}"
+    data = cache.get(key) if cache is not None else None
+    if data is None:
+        months, block = _simulate_modes(**inputs)
+        data = {"period": month_end(months[: block.shape[2]]), "values": block}
+        if cache is not None:
+            cache.put(key, data)
+    return RepaymentResult(data["values"], data["period"], hash_)
+
+
+def simulate_repayment_batch(
+    initial_salary: np.ndarray,
+    salary_growth: np.ndarray,
+    loan: np.ndarray,
+    graduation_year: int,
+    interest_rate: np.ndarray | dict[int, float],
+    salary_sacrifice: np.ndarray,
+    plan: str | np.ndarray = "Plan 2",
+    instant_repayment: np.ndarray = 0,
+    extra_repayments: np.ndarray = 0,
+    repayment_threshold: np.ndarray | dict[int, float] = None,
+    trim: bool = False,
+    as_of: date = None,
+) -> dict[str, np.ndarray]:
+    """
+    Simulates the repayment of many student loans at once.
+
+    Every scenario is simulated in lockstep over the same months, as rows of 2D (scenario, month)
+    arrays, so no DataFrames are constructed. The inputs are broadcast against each other, so any
+    of them can be a scalar shared by all scenarios. Unlike `simulate_repayment`, each scenario is
+    a single trajectory that makes its own instant and extra repayments and the results are only
+    trimmed if `trim` is True.
+
+    Parameters:
+    initial_salary (np.ndarray): The initial salary of each student.
+    salary_growth (np.ndarray): The annual growth rate of each salary.
+    loan (np.ndarray): The initial amount of each loan.
+    graduation_year (int): The year of graduation, shared by all scenarios.
+    interest_rate (np.ndarray | dict[int, float]): The annual interest rate of each loan. Can also be a 2D (scenario, month) array or a dictionary shared by all scenarios, see `monthly_schedule`.
+    salary_sacrifice (np.ndarray): The proportion of each salary to be sacrificed to things such as pension contributions.
+    plan (str | np.ndarray): The repayment plan of each loan. Default is "Plan 2".
+    instant_repayment (np.ndarray): Additional repayment to be made immediately. Default is 0.
+    extra_repayments (np.ndarray): Additional repayments to be made. Can be a constant monthly amount for each scenario or a 2D (scenario, month) array of repayment amounts. Months beyond the end of a 2D array are not repaid. Default is 0.
+    repayment_threshold (np.ndarray | dict[int, float]): The annual income above which each loan is repaid, replacing the threshold of the plan in the tax rules. Can also be a 2D (scenario, month) array or a dictionary shared by all scenarios, see `monthly_schedule`. Default is None, for the thresholds in the tax rules.
+    trim (bool): Whether to stop simulating once every loan has been repaid, in which case the results end at the month the last loan was repaid in. Default is False.
+    as_of (date): The date that the simulation starts from. Default is today.
+
+    Returns:
+    dict[str, np.ndarray]: The simulation results. "period" holds the last day of each month,
+        "input hash" holds the `input_hash` of the parameters and every other column, the same as
+        those of `simulate_repayment`, is a 2D (scenario, month) array.
+    """
+    as_of = as_of or date.today()
     end_date = date(graduation_year + 31, 4, 1)
-    periods = pd.date_range(start=start_date, end=end_date, freq="m")
-
-    num_preiods = len(periods)
-    columns = [
-        "gross",
-        "net",
-        "loan",
-        "interest",
-        "salary repayment",
-        "extra repayment",
+    months = month_range(as_of, end_date)
+
+    # Schedules are expanded to the value of each month
+    if isinstance(interest_rate, dict) or np.ndim(interest_rate) == 2:
+        interest_rate = np.atleast_2d(
+            monthly_schedule(interest_rate, months, INTEREST_RATE_MONTH)
+        )
+    if isinstance(repayment_threshold, dict) or np.ndim(repayment_threshold) == 2:
+        repayment_threshold = np.atleast_2d(
+            monthly_schedule(repayment_threshold, months, THRESHOLD_MONTH)
+        )
+    elif repayment_threshold is not None:
+        repayment_threshold = np.atleast_1d(repayment_threshold)[:, None]
+
+    inputs = [
+        np.atleast_1d(value)
+        for value in (
+            initial_salary,
+            salary_growth,
+            loan,
+            interest_rate,
+            salary_sacrifice,
+            plan,
+            instant_repayment,
+        )
     ]
+    num_scenarios = np.broadcast_shapes(
+        *(value.shape[:1] for value in inputs),
+        np.shape(repayment_threshold)[:1],
+        np.shape(extra_repayments)[:1],
+    )[0]
+    inputs = [
+        np.broadcast_to(value, (num_scenarios, *value.shape[1:])) for value in inputs
+    ]
+
+    extra_repayments = np.asarray(extra_repayments, dtype=float)
+    extra_repayment = np.zeros((num_scenarios, len(months)))
+    if extra_repayments.ndim == 2:
+        extra_repayments = extra_repayments[:, : len(months)]
+        extra_repayment[:, : extra_repayments.shape[1]] = extra_repayments
+    else:
+        extra_repayment[:] = np.broadcast_to(extra_repayments, num_scenarios)[:, None]
 
-    data = {
-        "active": np.zeros((num_preiods, len(columns))),
-        "passive": np.zeros((num_preiods, len(columns))),
+    data = _simulate(months, *inputs, extra_repayment, repayment_threshold, trim=trim)
+    return {
+        "period": month_end(months[: data["loan"].shape[1]]),
+        "input hash": input_hash(
+            initial_salary=initial_salary,
+            salary_growth=salary_growth,
+            loan=loan,
+            graduation_year=graduation_year,
+            interest_rate=interest_rate,
+            salary_sacrifice=salary_sacrifice,
+            plan=plan,
+            instant_repayment=instant_repayment,
+            extra_repayments=extra_repayments,
+            repayment_threshold=repayment_threshold,
+            trim=trim,
+            as_of=as_of,
+        ),
+        **data,
     }
 
-    for mode in data:
-        # Initial gross monthly income
-        data[mode][0, 0] = initial_salary / 12
-        # Initial loan amount
-        data[mode][0, 2] = loan
 
-    if instant_repayment:
-        data["active"][0, 2] -= min(instant_repayment, loan)
+def summarise_repayment(
+    data: dict[str, np.ndarray],
+    instant_repayment: np.ndarray = 0,
+    discount_rate: float = 0.05,
+) -> dict[str, np.ndarray]:
+    """
+    Reduces the results of `simulate_repayment_batch` to a few numbers per scenario.
 
-    if extra_repayments:
-        if isinstance(extra_repayments, float):
-            data["active"][:, 5] = extra_repayments
-        else:
-            for k, v in extra_repayments.items():
-                if k < num_preiods:
-                    data["active"][k, 5] = v
-
-    def calculate_monthly_interest(current_loan, current_period):
-        days_in_month = monthrange(current_period.year, current_period.month)[1]
-        days_in_year = 365 + isleap(current_period.year)
-        monthly_interest_rate = (1 + interest_rate) ** (
-            days_in_month / days_in_year
-        ) - 1
-        return current_loan * monthly_interest_rate
-
-    for i in range(1, num_preiods):
-        current_period = periods[i - 1]
-
-        for mode in data:
-            # Gross income growth and adjustment for salary sacrifice
-            data[mode][i, 0] = data[mode][i - 1, 0]
-            if current_period.month == 12:
-                data[mode][i, 0] *= 1 + salary_growth
-            gross = data[mode][i, 0] * (1 - salary_sacrifice)
-
-            # Interest calculation and loan update
-            if data[mode][i - 1, 2] >= 0:
-                data[mode][i - 1, 3] = calculate_monthly_interest(
-                    data[mode][i - 1, 2], current_period
-                )
-                data[mode][i, 2] = data[mode][i - 1, 2] + data[mode][i - 1, 3]
-
-                # Salary repayment
-                data[mode][i - 1, 4] = monthly(student_loan_repayment, gross, plan)
-                data[mode][i, 2] -= data[mode][i - 1, 4]
-
-                if data[mode][i, 2] < 0:
-                    data[mode][i - 1, 4] += data[mode][i, 2]
-                    data[mode][i - 1 :, 5] = 0
-                    data[mode][i, 2] = 0
-
-                # Extra repayment
-                if mode == "active":
-                    data[mode][i, 2] -= data[mode][i - 1, 5]
-                    if data[mode][i, 2] < 0:
-                        data[mode][i - 1, 5] += data[mode][i, 2]
-                        data[mode][i:, 5] = 0
-                        data[mode][i, 2] = 0
-
-            # Net income after tax and repayments
-            data[mode][i - 1, 1] = (
-                gross - monthly(income_tax, gross) - monthly(national_insurance, gross)
-            ) - (data[mode][i - 1, 4] + data[mode][i - 1, 5])
-
-    df_active = pd.DataFrame(data["active"], index=periods, columns=columns)
-    df_passive = pd.DataFrame(data["passive"], index=periods, columns=columns)
-
-    # Merge the passive and active data
-    df = pd.merge(
-        left=df_passive,
-        right=df_active,
-        how="outer",
-        left_index=True,
-        right_index=True,
-        suffixes=(" passive", " active"),
+    Repayments are discounted by calendar year, the same as the student loan notebook, so the
+    repayments made this year are not discounted.
+
+    Parameters:
+    data (dict[str, np.ndarray]): The results of `simulate_repayment_batch`.
+    instant_repayment (np.ndarray): The instant repayment made by each scenario, which is not included in `data`. Default is 0.
+    discount_rate (float): The annual discount rate used for the net present value. Default is 0.05.
+
+    Returns:
+    dict[str, np.ndarray]: The summary of each scenario. The keys are:
+        - "months to repay": Number of months of repayments before the loan is repaid or written off.
+        - "total repaid": Total amount repaid, including the instant repayment.
+        - "total repaid npv": Net present value of the total amount repaid.
+        - "written off": Loan balance that is written off at the end of the loan.
+    """
+    loan = data["loan"]
+    num_periods = loan.shape[1]
+    repayment = data["salary repayment"] + data["extra repayment"]
+    years = data["period"].astype("datetime64[Y]").astype(int)
+    discount_factor = (1 + discount_rate) ** -(years - years[0])
+    return {
+        "months to repay": np.minimum((loan != 0).sum(axis=1), num_periods - 1),
+        "total repaid": repayment.sum(axis=1) + instant_repayment,
+        "total repaid npv": repayment @ discount_factor + instant_repayment,
+        "written off": loan[:, -1],
+    }
+
+
+def simulate_repayment_summary(
+    initial_salary: float,
+    salary_growth: float,
+    loan: float,
+    graduation_year: int,
+    interest_rate: float | np.ndarray | dict[int, float],
+    salary_sacrifice: float,
+    plan: str = "Plan 2",
+    instant_repayment: float = None,
+    extra_repayments: float | dict[int:float] = None,
+    repayment_threshold: float | np.ndarray | dict[int, float] = None,
+    discount_rate: float = 0.05,
+    as_of: date = None,
+) -> dict[str, float]:
+    """
+    Simulates the repayment of a student loan, only returning a summary of the results.
+
+    This takes the same parameters as `simulate_repayment` but skips building the DataFrame, so it
+    is much cheaper to call many times, e.g. when searching for the best extra repayments.
+
+    Parameters:
+    discount_rate (float): The annual discount rate used for the net present value. Default is 0.05.
+    as_of (date): The date that the simulation starts from. Default is today.
+
+    See `simulate_repayment` for the other parameters.
+
+    Returns:
+    dict[str, float]: The summary of the passive and active modes, see `summarise_repayment`,
+        with the mode appended to each key, e.g. "total repaid npv active". "interest saved" is the
+        difference between the net present value repaid in the passive and active modes.
+    """
+    months, block = _simulate_modes(
+        initial_salary,
+        salary_growth,
+        loan,
+        graduation_year,
+        interest_rate,
+        salary_sacrifice,
+        plan,
+        instant_repayment,
+        extra_repayments,
+        repayment_threshold,
+        as_of or date.today(),
+    )
+    data = dict(zip(COLUMNS, block.swapaxes(0, 1)))
+    data["period"] = month_end(months[: block.shape[2]])
+    summary = summarise_repayment(data, [0, instant_repayment or 0], discount_rate)
+
+    result = {
+        f"{key} {mode}": value.item()
+        for key, values in summary.items()
+        for mode, value in zip(MODES, values)
+    }
+    npv = summary["total repaid npv"]
+    result["interest saved"] = (npv[0] - npv[1]).item()
+    return result
+
+
+def _percentile(values: np.ndarray, percentiles: tuple[float, ...]) -> np.ndarray:
+    """
+    Calculates percentiles along the first axis, the same as `np.percentile`.
+
+    The values are sorted once, which is faster than `np.percentile` partitioning them for every
+    percentile when there are many columns.
+
+    Returns:
+    np.ndarray: The percentiles, where the first axis is the percentile.
+    """
+    values = np.sort(values, axis=0)
+    position = np.asarray(percentiles) / 100 * (len(values) - 1)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, len(values) - 1)
+    fraction = (position - lower).reshape(-1, *[1] * (values.ndim - 1))
+    return values[lower] * (1 - fraction) + values[upper] * fraction
+
+
+def simulate_repayment_monte_carlo(
+    initial_salary: float,
+    salary_growth: float,
+    loan: float,
+    graduation_year: int,
+    interest_rate: float,
+    salary_sacrifice: float,
+    plan: str = "Plan 2",
+    instant_repayment: float = 0,
+    extra_repayments: float = 0,
+    salary_growth_volatility: float = 0.02,
+    inflation_volatility: float = 0.01,
+    correlation: float = 0.5,
+    num_paths: int = 10_000,
+    seed: int | np.random.Generator = None,
+    percentiles: tuple[float, ...] = (5, 25, 50, 75, 95),
+    discount_rate: float = 0.05,
+    as_of: date = None,
+) -> dict[str, np.ndarray]:
+    """
+    Simulates the repayment of a student loan over many random paths of salary growth and inflation.
+
+    Every calendar year of each path draws a salary growth and an inflation (RPI) shock from a
+    bivariate normal distribution. The salary grows by `salary_growth` plus its shock and the loan
+    accrues `interest_rate` plus the inflation shock, which cannot make it negative. All paths are
+    simulated at once by `simulate_repayment_batch`'s engine, stopping once every loan is repaid.
+
+    Parameters:
+    initial_salary (float): The initial salary of the student.
+    salary_growth (float): The mean annual growth rate of the salary.
+    loan (float): The initial amount of the loan.
+    graduation_year (int): The year of graduation.
+    interest_rate (float): The mean annual interest rate of the loan.
+    salary_sacrifice (float): The proportion of the salary to be sacrificed to things such as pension contributions.
+    plan (str): The repayment plan. Default is "Plan 2".
+    instant_repayment (float): Additional repayment to be made immediately. Default is 0.
+    extra_repayments (float): Additional repayment to be made every month. Default is 0.
+    salary_growth_volatility (float): The standard deviation of the annual salary growth. Default is 0.02.
+    inflation_volatility (float): The standard deviation of the annual inflation, and so of the interest rate. Default is 0.01.
+    correlation (float): The correlation between the salary growth and inflation of each year. Default is 0.5.
+    num_paths (int): The number of paths to simulate. Default is 10,000.
+    seed (int | np.random.Generator): The seed of the random paths, or the generator to draw them from. Default is None, for a random seed.
+    percentiles (tuple[float, ...]): The percentiles of the results to return. Default is (5, 25, 50, 75, 95).
+    discount_rate (float): The annual discount rate used for the net present value. Default is 0.05.
+    as_of (date): The date that the simulation starts from. Default is today.
+
+    Returns:
+    dict[str, np.ndarray]: The distribution of the results over the paths. The keys are:
+        - "period": The last day of each month.
+        - "percentiles": The percentiles of the other results.
+        - "loan": The (percentile, month) loan balance.
+        - "total repaid": The percentiles of the total amount repaid, including the instant repayment.
+        - "total repaid npv": The percentiles of the net present value of the total amount repaid.
+        - "write-off probability": The proportion of paths in which some of the loan is written off.
+    """
+    end_date = date(graduation_year + 31, 4, 1)
+    months = month_range(as_of or date.today(), end_date)
+
+    # Each month uses the draws of its calendar year
+    years = months.astype("datetime64[Y]").astype(int)
+    years -= years[0]
+    generator = np.random.default_rng(seed)
+    shocks = generator.standard_normal((2, num_paths, years[-1] + 1))
+    shocks[1] *= np.sqrt(1 - correlation**2)
+    shocks[1] += correlation * shocks[0]
+    growth = salary_growth + salary_growth_volatility * shocks[0]
+    rate = np.maximum(interest_rate + inflation_volatility * shocks[1], 0)
+
+    inputs = np.broadcast_arrays(
+        *np.atleast_1d(initial_salary, loan, salary_sacrifice, plan, instant_repayment),
+        np.empty(num_paths),
+    )[:-1]
+    initial_salary, loan, salary_sacrifice, plan, instant_repayment = inputs
+    extra_repayment = np.full((num_paths, len(months)), float(extra_repayments))
+    data = _simulate(
+        months,
+        initial_salary,
+        growth[:, years],
+        loan,
+        rate[:, years],
+        salary_sacrifice,
+        plan,
+        instant_repayment,
+        extra_repayment,
+        trim=True,
     )
+    data["period"] = month_end(months[: data["loan"].shape[1]])
+    summary = summarise_repayment(data, instant_repayment, discount_rate)
+
+    return {
+        "period": data["period"],
+        "percentiles": np.asarray(percentiles),
+        "loan": _percentile(data["loan"], percentiles),
+        "total repaid": _percentile(summary["total repaid"], percentiles),
+        "total repaid npv": _percentile(summary["total repaid npv"], percentiles),
+        "write-off probability": np.mean(summary["written off"] > 0),
+    }
 
-    # Trim the dataframe to only include periods where the loan is being repaid
-    if df["loan passive"].iloc[-1] == 0:
-        df = df[: df["loan passive"].argmin() + 1]
-    return df
+
+def optimise_overpayment(
+    initial_salary: float,
+    salary_growth: float,
+    loan: float,
+    graduation_year: int,
+    interest_rate: float,
+    salary_sacrifice: float,
+    plan: str = "Plan 2",
+    instant_repayment: float | np.ndarray = 0,
+    max_extra_repayment: float = 2000,
+    num_points: int = 101,
+    refinements: int = 2,
+    discount_rate: float = 0.05,
+    as_of: date = None,
+) -> dict[str, np.ndarray]:
+    """
+    Finds the constant monthly extra repayment that minimises the net present value repaid.
+
+    Every extra repayment on an evenly spaced grid, for every instant repayment, is simulated as
+    one batch. The extra repayments are then refined between the neighbours of the best one
+    `refinements` times, each of which is another batch.
+
+    Parameters:
+    initial_salary (float): The initial salary of the student.
+    salary_growth (float): The annual growth rate of the salary.
+    loan (float): The initial amount of the loan.
+    graduation_year (int): The year of graduation.
+    interest_rate (float): The annual interest rate of the loan.
+    salary_sacrifice (float): The proportion of the salary to be sacrificed to things such as pension contributions.
+    plan (str): The repayment plan. Default is "Plan 2".
+    instant_repayment (float | np.ndarray): Additional repayment to be made immediately, or an array of them to optimise over as well. Default is 0.
+    max_extra_repayment (float): The largest monthly extra repayment to consider. Default is 2000.
+    num_points (int): The number of extra repayments in the grid and in each refinement. Default is 101.
+    refinements (int): The number of times the grid is refined. Default is 2.
+    discount_rate (float): The annual discount rate used for the net present value. Default is 0.05.
+    as_of (date): The date that the simulation starts from. Default is today.
+
+    Returns:
+    dict[str, np.ndarray]: The optimum and the curve it was found on. The keys are:
+        - "extra repayment": The best monthly extra repayment.
+        - "instant repayment": The best instant repayment.
+        - "total repaid npv": The net present value repaid with the best repayments.
+        - "extra repayments": The extra repayments of the initial grid.
+        - "instant repayments": The instant repayments of the initial grid.
+        - "npv curve": The (instant repayment, extra repayment) net present value repaid on the initial grid.
+    """
+    end_date = date(graduation_year + 31, 4, 1)
+    months = month_range(as_of or date.today(), end_date)
+    instant_repayments = np.atleast_1d(np.asarray(instant_repayment, dtype=float))
+
+    def total_repaid_npv(extra: np.ndarray) -> np.ndarray:
+        # Every combination of instant and extra repayment is a scenario
+        instant = np.repeat(instant_repayments, len(extra))
+        inputs = np.broadcast_arrays(
+            *np.atleast_1d(
+                initial_salary, salary_growth, loan, interest_rate, salary_sacrifice
+            ),
+            np.atleast_1d(plan),
+            instant,
+        )
+        extra_repayment = np.empty((len(instant), len(months)))
+        extra_repayment[:] = np.tile(extra, len(instant_repayments))[:, None]
+        data = _simulate(months, *inputs, extra_repayment, trim=True)
+        data["period"] = month_end(months[: data["loan"].shape[1]])
+        summary = summarise_repayment(data, instant, discount_rate)
+        return summary["total repaid npv"].reshape(len(instant_repayments), -1)
+
+    grid = extra = np.linspace(0, max_extra_repayment, num_points)
+    curve = npv = total_repaid_npv(extra)
+    for _ in range(refinements):
+        j = np.argmin(npv.min(axis=0))
+        extra = np.linspace(
+            extra[max(j - 1, 0)], extra[min(j + 1, len(extra) - 1)], num_points
+        )
+        npv = total_repaid_npv(extra)
+    i, j = np.unravel_index(np.argmin(npv), npv.shape)
+
+    return {
+        "extra repayment": extra[j],
+        "instant repayment": instant_repayments[i],
+        "total repaid npv": npv[i, j],
+        "extra repayments": grid,
+        "instant repayments": instant_repayments,
+        "npv curve": curve,
+    }
@@ -0,0 +1,187 @@
+import argparse
+import sys
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.loan import student_loan_repayment
+from utils.schedule import Workspace
+from utils.tax import income_tax, national_insurance
+
+PARQUET_SUFFIXES = {".parquet", ".pq"}
+
+
+def peak_rss_mib() -> float:
+    """
+    Finds the peak resident set size of the current process.
+
+    Returns:
+    float: The peak resident set size in MiB, or NaN if it cannot be measured on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def read_chunks(path: str | Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Reads a CSV or Parquet file in chunks, so that it never has to fit in memory.
+
+    Parameters:
+    path (str | Path): The file to read. Files ending in ".parquet" or ".pq" are read as Parquet (which requires `pyarrow`), any others as CSV.
+    chunk_size (int): The maximum number of rows in each chunk.
+
+    Yields:
+    pd.DataFrame: The next chunk of rows.
+    """
+    if Path(path).suffix in PARQUET_SUFFIXES:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def write_chunks(path: str | Path, chunks: Iterator[pd.DataFrame]) -> None:
+    """
+    Writes chunks to a CSV or Parquet file as they arrive.
+
+    Parameters:
+    path (str | Path): The file to write. Files ending in ".parquet" or ".pq" are written as Parquet (which requires `pyarrow`), any others as CSV.
+    chunks (Iterator[pd.DataFrame]): The chunks to write, which must all have the same columns.
+    """
+    if Path(path).suffix in PARQUET_SUFFIXES:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = writer or pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(path, mode="a" if i else "w", header=not i, index=False)
+
+
+def evaluate_chunk(
+    chunk: pd.DataFrame,
+    income_column: str = "gross_income",
+    plan: str = None,
+    plan_column: str = None,
+    year: int = None,
+    out: np.ndarray = None,
+    workspace: Workspace = None,
+) -> pd.DataFrame:
+    """
+    Adds the income tax, national insurance and student loan repayment of every row of a chunk.
+
+    Parameters:
+    chunk (pd.DataFrame): The rows to evaluate.
+    income_column (str, optional): The column containing the annual gross income. Defaults to "gross_income".
+    plan (str, optional): The student loan repayment plan of every row. Defaults to None.
+    plan_column (str, optional): The column containing the student loan repayment plan of each row, which takes precedence over `plan`. Empty values mean no student loan. Defaults to None.
+    year (int, optional): The tax year whose rules are used, see `utils.rules.get_tax_year`. Defaults to the current tax year.
+    out (np.ndarray, optional): A (3, rows) array to reuse for the results, which can be longer than the chunk. Defaults to None.
+    workspace (Workspace, optional): The scratch arrays to reuse between chunks. Defaults to None.
+
+    Returns:
+    pd.DataFrame: The chunk with "income tax", "national insurance" and "student loan" columns added.
+    """
+    income = chunk[income_column].to_numpy(dtype=float)
+    out = np.empty((3, len(income))) if out is None else out[:, : len(income)]
+    income_tax(income, year, out=out[0], workspace=workspace)
+    national_insurance(income, year, out=out[1], workspace=workspace)
+
+    if plan_column is not None:
+        out[2] = 0
+        plans = chunk[plan_column].to_numpy()
+        for plan_ in pd.unique(plans[pd.notna(plans)]):
+            rows = plans == plan_
+            out[2, rows] = student_loan_repayment(income[rows], plan_, year)
+    elif plan is not None:
+        student_loan_repayment(income, plan, year, out=out[2], workspace=workspace)
+    else:
+        out[2] = 0
+
+    return chunk.assign(
+        **{"income tax": out[0], "national insurance": out[1], "student loan": out[2]}
+    )
+
+
+def evaluate_payroll(
+    source: str | Path,
+    destination: str | Path,
+    income_column: str = "gross_income",
+    plan: str = None,
+    plan_column: str = None,
+    year: int = None,
+    chunk_size: int = 1_000_000,
+) -> dict[str, float]:
+    """
+    Streams a payroll file through the tax functions, holding at most one chunk in memory.
+
+    Each chunk of `source` is read, evaluated with `evaluate_chunk` and appended to `destination`
+    before the next is read, so memory use is bounded by `chunk_size` regardless of file size.
+
+    Parameters:
+    source (str | Path): The CSV or Parquet file to read, see `read_chunks`.
+    destination (str | Path): The CSV or Parquet file to write, see `write_chunks`.
+    income_column (str, optional): The column containing the annual gross income. Defaults to "gross_income".
+    plan (str, optional): The student loan repayment plan of every row. Defaults to None.
+    plan_column (str, optional): The column containing the student loan repayment plan of each row. Defaults to None.
+    year (int, optional): The tax year whose rules are used, see `utils.rules.get_tax_year`. Defaults to the current tax year.
+    chunk_size (int, optional): The maximum number of rows held in memory at once. Defaults to 1,000,000.
+
+    Returns:
+    dict[str, float]: The number of "rows", the "seconds" taken, the "rows per second" and the
+        "peak rss (MiB)" of the process.
+    """
+    out = np.empty((3, chunk_size))
+    workspace = Workspace()
+    rows = 0
+
+    def evaluated_chunks():
+        nonlocal rows
+        for chunk in read_chunks(source, chunk_size):
+            rows += len(chunk)
+            yield evaluate_chunk(
+                chunk, income_column, plan, plan_column, year, out, workspace
+            )
+
+    start = time.perf_counter()
+    write_chunks(destination, evaluated_chunks())
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "rows per second": rows / seconds if seconds else float("nan"),
+        "peak rss (MiB)": peak_rss_mib(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=evaluate_payroll.__doc__.split("\n")[1].strip()
+    )
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--income-column", default="gross_income")
+    parser.add_argument("--plan")
+    parser.add_argument("--plan-column")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    stats = evaluate_payroll(**vars(parser.parse_args()))
+    print(", ".join(f"{k}: {v:,.1f}" for k, v in stats.items()))
@@ -0,0 +1,256 @@
+import hashlib
+from dataclasses import dataclass, replace
+from datetime import date
+from functools import cache, cached_property
+
+import numpy as np
+
+from utils.schedule import Schedule
+
+
+@dataclass(frozen=True)
+class TaxYear:
+    """
+    The tax and student loan rules of one tax year, which starts on 6 April of `year`.
+
+    The rules are stored as data and compiled into schedules the first time they are used.
+
+    Attributes:
+        year (int): The calendar year that the tax year starts in.
+        income_tax_bands (tuple[tuple[float, float, float], ...]): The rate, lower limit and upper limit of each income tax band, for the full personal allowance. The first band must start at the personal allowance.
+        personal_allowance_taper (tuple[float, float]): The income over which the personal allowance is reduced, and how much it is reduced by for every pound over it.
+        national_insurance_bands (tuple[tuple[float, float, float], ...]): The rate, lower limit and upper limit of each national insurance band.
+        student_loan_plans (dict[str, dict[str, float]]): The "threshold" and "percentage" of each student loan repayment plan.
+        jurisdiction (str): The part of the UK that the rules apply in. Default is "England".
+    """
+
+    year: int
+    income_tax_bands: tuple[tuple[float, float, float], ...]
+    personal_allowance_taper: tuple[float, float]
+    national_insurance_bands: tuple[tuple[float, float, float], ...]
+    student_loan_plans: dict[str, dict[str, float]]
+    jurisdiction: str = "England"
+
+    @cached_property
+    def income_tax_schedule(self) -> Schedule:
+        """
+        The compiled income tax schedule.
+
+        Reducing the personal allowance moves the limits of every band above it down by the same
+        amount, so each pound of allowance lost is taxed at the marginal rate at the taper
+        threshold. The taper is therefore compiled as another band between the taper threshold
+        and the income at which the personal allowance reaches 0.
+        """
+        _, personal_allowance, _ = self.income_tax_bands[0]
+        threshold, reduction = self.personal_allowance_taper
+        rate = sum(
+            r for r, lower, upper in self.income_tax_bands if lower <= threshold < upper
+        )
+        taper = (
+            rate * reduction,
+            threshold,
+            threshold + personal_allowance / reduction,
+        )
+        return Schedule.from_bands([*self.income_tax_bands, taper])
+
+    @cached_property
+    def national_insurance_schedule(self) -> Schedule:
+        """The compiled national insurance schedule."""
+        return Schedule.from_bands(self.national_insurance_bands)
+
+    @cached_property
+    def taxes_schedule(self) -> Schedule:
+        """The compiled schedule of income tax and national insurance combined."""
+        return self.income_tax_schedule + self.national_insurance_schedule
+
+    @cached_property
+    def student_loan_schedules(self) -> dict[str, Schedule]:
+        """The compiled repayment schedule of each student loan repayment plan."""
+        return {
+            plan: Schedule.from_bands(
+                [(terms["percentage"], terms["threshold"], float("inf"))]
+            )
+            for plan, terms in self.student_loan_plans.items()
+        }
+
+    def student_loan_schedule(self, plan: str) -> Schedule:
+        """
+        Gets the compiled repayment schedule of a student loan repayment plan.
+
+        Parameters:
+        plan (str): The repayment plan. It must be one of `student_loan_plans`.
+
+        Returns:
+        Schedule: The repayment schedule, which can be added to the other schedules.
+
+        Raises:
+        AssertionError: If the provided plan does not exist in this tax year.
+        """
+        plans = self.student_loan_schedules
+        assert plan in plans, f"`plan` must be one of: {list(plans.keys())}"
+        return plans[plan]
+
+    def uprated(self, year: int, factor: float) -> "TaxYear":
+        """
+        Creates the rules of a later tax year by uprating every threshold of this one.
+
+        Parameters:
+        year (int): The tax year of the new rules.
+        factor (float): The factor that every threshold is multiplied by, e.g. 1.02 for 2% uprating.
+
+        Returns:
+        TaxYear: The uprated rules, which still need to be registered.
+        """
+
+        def uprate(bands):
+            return tuple(
+                (rate, lower * factor, upper * factor) for rate, lower, upper in bands
+            )
+
+        threshold, reduction = self.personal_allowance_taper
+        return replace(
+            self,
+            year=year,
+            income_tax_bands=uprate(self.income_tax_bands),
+            personal_allowance_taper=(threshold * factor, reduction),
+            national_insurance_bands=uprate(self.national_insurance_bands),
+            student_loan_plans={
+                plan: {**terms, "threshold": terms["threshold"] * factor}
+                for plan, terms in self.student_loan_plans.items()
+            },
+        )
+
+
+# Registered rules, keyed by jurisdiction and tax year
+RULES: dict[tuple[str, int], TaxYear] = {}
+
+# Incremented whenever rules are registered, so that cached results can be invalidated
+_version = 0
+
+
+def register(rules: TaxYear) -> TaxYear:
+    """
+    Registers the rules of a tax year, replacing any already registered for that year.
+
+    Parameters:
+    rules (TaxYear): The rules to register.
+
+    Returns:
+    TaxYear: The registered rules.
+    """
+    global _version
+    RULES[(rules.jurisdiction, rules.year)] = rules
+    _version += 1
+    _get_tax_year.cache_clear()
+    get_tax_years.cache_clear()
+    rules_hash.cache_clear()
+    return rules
+
+
+def rules_version() -> int:
+    """
+    Finds the version of the registered rules, which changes whenever rules are registered.
+
+    Returns:
+    int: The version, for use in the keys of caches of results that depend on the rules.
+    """
+    return _version
+
+
+@cache
+def rules_hash() -> str:
+    """
+    Calculates a hash of the registered rules, which unlike `rules_version` is the same in every
+    process that registers the same rules.
+
+    Returns:
+    str: The hexadecimal SHA-256 hash of the registered rules, for use in the keys of persistent caches.
+    """
+    rules = sorted(RULES.items(), key=lambda item: item[0])
+    return hashlib.sha256(repr(rules).encode()).hexdigest()
+
+
+def current_tax_year(today: date = None) -> int:
+    """
+    Finds the tax year that a date falls in.
+
+    Parameters:
+    today (date, optional): The date. Defaults to today.
+
+    Returns:
+    int: The calendar year that the tax year starts in.
+    """
+    today = today or date.today()
+    return today.year - (today < date(today.year, 4, 6))
+
+
+def get_tax_year(year: int = None, jurisdiction: str = "England") -> TaxYear:
+    """
+    Looks up the rules of a tax year.
+
+    Thresholds are assumed to be frozen after the latest registered year, so a later year uses
+    the latest rules registered before it. Earlier years use the earliest registered rules.
+
+    Parameters:
+    year (int, optional): The calendar year that the tax year starts in. Defaults to the current tax year, as of each call.
+    jurisdiction (str, optional): The part of the UK that the rules apply in. Defaults to "England".
+
+    Returns:
+    TaxYear: The rules of the tax year.
+
+    Raises:
+    AssertionError: If no rules have been registered for the jurisdiction.
+    """
+    year = current_tax_year() if year is None else year
+    return _get_tax_year(year, jurisdiction)
+
+
+@cache
+def _get_tax_year(year: int, jurisdiction: str) -> TaxYear:
+    # The year is resolved by `get_tax_year` so that the current tax year is never cached
+    years = sorted(y for j, y in RULES if j == jurisdiction)
+    assert years, f"`jurisdiction` must be one of: {sorted({j for j, _ in RULES})}"
+    index = max(np.searchsorted(years, year, side="right") - 1, 0)
+    return RULES[(jurisdiction, years[index])]
+
+
+@cache
+def get_tax_years(
+    start: int, stop: int, jurisdiction: str = "England"
+) -> tuple[TaxYear, ...]:
+    """
+    Looks up the rules of a range of tax years, so that the rules of each year can be found by index.
+
+    Parameters:
+    start (int): The first tax year.
+    stop (int): The tax year after the last.
+    jurisdiction (str, optional): The part of the UK that the rules apply in. Defaults to "England".
+
+    Returns:
+    tuple[TaxYear, ...]: The rules of each tax year, where index 0 is `start`.
+    """
+    return tuple(get_tax_year(year, jurisdiction) for year in range(start, stop))
+
+
+register(
+    TaxYear(
+        year=2024,
+        income_tax_bands=(
+            (0.2, 12_570, 50_270),
+            (0.4, 50_270, 125_140),
+            (0.45, 125_140, float("inf")),
+        ),
+        personal_allowance_taper=(100_000, 0.5),
+        national_insurance_bands=(
+            (0.08, 12_576, 50_268),
+            (0.02, 50_268, float("inf")),
+        ),
+        student_loan_plans={
+            "Plan 1": {"threshold": 22_015, "percentage": 0.09},
+            "Plan 2": {"threshold": 27_295, "percentage": 0.09},
+            "Plan 4": {"threshold": 27_660, "percentage": 0.09},
+            "Plan 5": {"threshold": 25_000, "percentage": 0.09},
+            "Postgraduate": {"threshold": 21_000, "percentage": 0.06},
+        },
+    )
+)
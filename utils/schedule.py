@@ -0,0 +1,183 @@
+import numpy as np
+
+# Number of elements evaluated at a time when writing into `out`, small enough that the
+# temporaries stay in the CPU cache
+BLOCK_SIZE = 8192
+
+
+class Workspace:
+    """
+    Scratch arrays that are reused between calls, so that repeated calls on inputs of the same
+    shape do not allocate any new temporaries.
+
+    A workspace must not be shared between threads.
+    """
+
+    def __init__(self):
+        self.arrays = {}
+
+    def array(self, name: str, size: int) -> np.ndarray:
+        """
+        Gets a scratch array, only allocating it if one of the same name and size does not exist.
+
+        Parameters:
+        name (str): The name of the array, so that arrays used at the same time are distinct.
+        size (int): The number of elements in the array.
+
+        Returns:
+        np.ndarray: The uninitialised scratch array.
+        """
+        array = self.arrays.get(name)
+        if array is None or len(array) != size:
+            array = self.arrays[name] = np.empty(size)
+        return array
+
+
+class Schedule:
+    """
+    A piecewise-linear function of income, such as a tax, compiled for fast evaluation.
+
+    The function is stored as the income at which each segment starts, along with the marginal
+    rate and intercept of each segment. Evaluating it is one `np.searchsorted` to find the segment
+    of each income followed by one multiply-add. When the result is written into `out`, it is
+    instead evaluated as a sum of hinge functions in cache-sized blocks, which allocates nothing.
+
+    Schedules can be added together to combine several taxes into one, e.g.
+    `rules.income_tax_schedule + rules.national_insurance_schedule`.
+    """
+
+    def __init__(
+        self, breakpoints: np.ndarray, rates: np.ndarray, intercepts: np.ndarray
+    ):
+        """
+        Parameters:
+        breakpoints (np.ndarray): The income at which each segment starts, in ascending order. The first must be `-inf`.
+        rates (np.ndarray): The marginal rate of each segment.
+        intercepts (np.ndarray): The value of each segment's line at an income of 0.
+        """
+        self.breakpoints = np.asarray(breakpoints, dtype=float)
+        self.rates = np.asarray(rates, dtype=float)
+        self.intercepts = np.asarray(intercepts, dtype=float)
+
+        # Where each change in marginal rate occurs, used when evaluating into `out`
+        changes = np.diff(self.rates)
+        self.hinges = list(
+            zip(self.breakpoints[1:][changes != 0], changes[changes != 0])
+        )
+
+    @classmethod
+    def from_bands(cls, bands: list[tuple[float, float, float]]) -> "Schedule":
+        """
+        Compiles a schedule from tax bands, each of which is calculated like `utils.tax.tax`.
+
+        Parameters:
+        bands (list[tuple[float, float, float]]): The rate, lower limit and upper limit of each band. The upper limit can be infinity.
+
+        Returns:
+        Schedule: The schedule of the sum of the bands.
+        """
+        edges = {edge for _, lower, upper in bands for edge in (lower, upper)}
+        breakpoints = np.array([-np.inf, *sorted(edges - {np.inf})])
+
+        rates = np.zeros(len(breakpoints))
+        values = np.zeros(len(breakpoints))
+        for rate, lower, upper in bands:
+            rates += rate * ((lower <= breakpoints) & (breakpoints < upper))
+            values += rate * np.clip(breakpoints - lower, 0, upper - lower)
+
+        # The first segment has a rate of 0, so its intercept is its value
+        intercepts = values
+        intercepts[1:] -= rates[1:] * breakpoints[1:]
+        return cls(breakpoints, rates, intercepts)
+
+    def segment(self, income: np.ndarray) -> np.ndarray:
+        """
+        Finds the index of the segment that each income falls in.
+
+        Parameters:
+        income (np.ndarray): The income to look up.
+
+        Returns:
+        np.ndarray: The segment indices.
+        """
+        return np.searchsorted(self.breakpoints, income, side="right") - 1
+
+    def __call__(
+        self,
+        income: np.ndarray,
+        out: np.ndarray = None,
+        workspace: Workspace = None,
+    ) -> np.ndarray:
+        """
+        Evaluates the schedule.
+
+        Parameters:
+        income (np.ndarray): The income on which the schedule is to be evaluated.
+        out (np.ndarray, optional): A contiguous array of the same shape as `income` to write the result into. It may be `income` itself. Defaults to None.
+        workspace (Workspace, optional): The scratch arrays to use when writing into `out`. Defaults to None, for a new workspace.
+
+        Returns:
+        np.ndarray: The value of the schedule, e.g. the tax due.
+
+        Raises:
+        ValueError: If `out` is not a C-contiguous array of the same shape as `income`, since the
+            result could not be written into it in place.
+        """
+        if out is None:
+            segment = self.segment(income)
+            return self.intercepts[segment] + self.rates[segment] * income
+
+        if out.shape != np.shape(income) or not out.flags.c_contiguous:
+            raise ValueError(
+                "`out` must be a C-contiguous array of the same shape as `income`"
+            )
+
+        # Tax schedules are continuous, so they can be written as a line plus a hinge
+        # function at each breakpoint where the marginal rate changes
+        workspace = workspace or Workspace()
+        income_block = workspace.array("income", BLOCK_SIZE)
+        scratch_block = workspace.array("scratch", BLOCK_SIZE)
+        income_flat, out_flat = np.ravel(income), out.reshape(-1)
+        for start in range(0, len(out_flat), BLOCK_SIZE):
+            stop = min(start + BLOCK_SIZE, len(out_flat))
+            x = income_block[: stop - start]
+            scratch = scratch_block[: stop - start]
+            block = out_flat[start:stop]
+            np.copyto(x, income_flat[start:stop])
+            np.multiply(x, self.rates[0], out=block)
+            block += self.intercepts[0]
+            for breakpoint, change in self.hinges:
+                np.subtract(x, breakpoint, out=scratch)
+                np.maximum(scratch, 0, out=scratch)
+                scratch *= change
+                block += scratch
+        return out
+
+    def marginal_rate(self, income: np.ndarray) -> np.ndarray:
+        """
+        Looks up the marginal rate, which is the rate of the segment that each income falls in.
+
+        Parameters:
+        income (np.ndarray): The income on which the marginal rate is to be found.
+
+        Returns:
+        np.ndarray: The marginal rate.
+        """
+        return self.rates[self.segment(income)]
+
+    def inverse(self) -> "Schedule":
+        """
+        Compiles the inverse of the schedule, which must be strictly increasing and continuous.
+
+        Returns:
+        Schedule: The schedule that maps the value of this schedule back to the income.
+        """
+        breakpoints = np.concatenate(([-np.inf], self(self.breakpoints[1:])))
+        return Schedule(breakpoints, 1 / self.rates, -self.intercepts / self.rates)
+
+    def __add__(self, other: "Schedule") -> "Schedule":
+        breakpoints = np.union1d(self.breakpoints, other.breakpoints)
+        segment, other_segment = self.segment(breakpoints), other.segment(breakpoints)
+        rates = self.rates[segment] + other.rates[other_segment]
+        intercepts = self.intercepts[segment] + other.intercepts[other_segment]
+        return Schedule(breakpoints, rates, intercepts)
@@ -1,8 +1,20 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+
 import numpy as np
 
+from utils.rules import get_tax_year
+from utils.schedule import Schedule, Workspace
+
 
 def tax(
-    income: np.ndarray, rate: float, lower: float = 0, upper: float = float("inf")
+    income: np.ndarray,
+    rate: float,
+    lower: float = 0,
+    upper: float = float("inf"),
+    out: np.ndarray = None,
 ) -> np.ndarray:
     """
     Calculates the tax based on the income, rate, lower and upper limit.
@@ -12,64 +24,179 @@ def tax(
     rate (float): The tax rate.
     lower (float, optional): The lower income limit for the tax bracket. Defaults to 0.
     upper (float, optional): The upper income limit for the tax bracket. Defaults to infinity.
+    out (np.ndarray, optional): The array to write the tax into, which may be `income` itself. Defaults to None.
 
     Returns:
     np.ndarray: The calculated tax.
     """
-    return np.maximum(0, np.minimum(upper - lower, income - lower)) * rate
+    if out is None:
+        return np.maximum(0, np.minimum(upper - lower, income - lower)) * rate
+    np.subtract(income, lower, out=out)
+    np.clip(out, 0, upper - lower, out=out)
+    out *= rate
+    return out
 
 
-def income_tax(gross_income: np.ndarray) -> np.ndarray:
+def income_tax(
+    gross_income: np.ndarray,
+    year: int = None,
+    out: np.ndarray = None,
+    workspace: Workspace = None,
+) -> np.ndarray:
     """
     Calculates the income tax based on the gross income.
 
-    The tax is calculated as follows:
+    The tax is calculated as follows (with the thresholds of the 2024 tax year):
     - The personal allowance is initially set at 12,570.
     - If the gross income exceeds 100,000, the personal allowance is reduced by 0.5 for every pound over 100,000.
     - The tax is then calculated in three brackets:
-        - Basic: 20% tax on income between the personal allowance and 50,270.
-        - Higher: 40% tax on income between 50,270 and 125,140.
+        - Basic: 20% tax on the first 37,700 of income over the personal allowance.
+        - Higher: 40% tax on income over that, up to 125,140.
         - Additional: 45% tax on income over 125,140.
 
+    While the personal allowance is being reduced, this results in a marginal rate of 60%.
+
+    These are compiled into the income tax schedule of the tax year, which is what is evaluated.
+
     Parameters:
     gross_income (np.ndarray): The gross income on which the tax is to be calculated.
+    year (int, optional): The tax year whose rules are used, see `utils.rules.get_tax_year`. Defaults to the current tax year.
+    out (np.ndarray, optional): The array to write the tax into, see `Schedule.__call__`. Defaults to None.
+    workspace (Workspace, optional): The scratch arrays to use when writing into `out`. Defaults to None.
 
     Returns:
     np.ndarray: The calculated tax.
     """
-    personal_allowance = 12_570
-    personal_allowance_reduction = 0.5 * np.maximum(0, gross_income - 100_000)
-    personal_allowance = np.maximum(
-        0, personal_allowance - personal_allowance_reduction
-    )
-
-    basic = tax(gross_income, 0.2, personal_allowance, 50_270)
-    higher = tax(gross_income, 0.4, 50_270, 125_140)
-    additional = tax(gross_income, 0.45, 125_140)
-    return basic + higher + additional
+    schedule = get_tax_year(year).income_tax_schedule
+    return schedule(gross_income, out=out, workspace=workspace)
 
 
-def national_insurance(gross_income: np.ndarray) -> np.ndarray:
+def national_insurance(
+    gross_income: np.ndarray,
+    year: int = None,
+    out: np.ndarray = None,
+    workspace: Workspace = None,
+) -> np.ndarray:
     """
     Calculates the national insurance based on the gross income.
 
-    The national insurance is calculated in two brackets:
+    The national insurance is calculated in two brackets (with the thresholds of the 2024 tax year):
     - Basic: 8% tax on income between 12,576 and 50,268.
     - Reduced: 2% tax on income over 50,268.
 
+    These are compiled into the national insurance schedule of the tax year, which is what is evaluated.
+
     Parameters:
     gross_income (np.ndarray): The gross income on which the national insurance is to be calculated.
+    year (int, optional): The tax year whose rules are used, see `utils.rules.get_tax_year`. Defaults to the current tax year.
+    out (np.ndarray, optional): The array to write the national insurance into, see `Schedule.__call__`. Defaults to None.
+    workspace (Workspace, optional): The scratch arrays to use when writing into `out`. Defaults to None.
 
     Returns:
     np.ndarray: The calculated national insurance.
     """
-    basic = tax(gross_income, 0.08, 12_576, 50_268)
-    reduced = tax(gross_income, 0.02, 50_268)
-    return basic + reduced
+    schedule = get_tax_year(year).national_insurance_schedule
+    return schedule(gross_income, out=out, workspace=workspace)
+
+
+def effective_tax_curve(
+    gross_income: np.ndarray, plan: str = None, year: int = None
+) -> dict[str, np.ndarray]:
+    """
+    Calculates the effective tax rate and net income for every gross income in a grid.
+
+    Income tax and national insurance (and the student loan repayments, if `plan` is given) are
+    evaluated in a single vectorized pass using their compiled schedules.
+
+    Parameters:
+    gross_income (np.ndarray): The gross incomes on which the curve is to be calculated.
+    plan (str, optional): The student loan repayment plan. Defaults to None, for no student loan.
+    year (int, optional): The tax year whose rules are used, see `utils.rules.get_tax_year`. Defaults to the current tax year.
+
+    Returns:
+    dict[str, np.ndarray]: The curve, containing:
+        - "effective tax": Income tax and national insurance as a proportion of gross income.
+        - "effective tax after loan": As above, but also including student loan repayments.
+        - "net income": Gross income after income tax and national insurance.
+        - "net income after loan": Net income after student loan repayments.
+    """
+    rules = get_tax_year(year)
+    gross_income = np.asarray(gross_income, dtype=float)
+    taxes = rules.taxes_schedule(gross_income)
+    loan = rules.student_loan_schedule(plan)(gross_income) if plan else 0
+    taxes_after_loan = taxes + loan
+
+    # The effective tax rate of no income is 0
+    def effective(tax: np.ndarray) -> np.ndarray:
+        rate = np.zeros_like(tax)
+        return np.divide(tax, gross_income, out=rate, where=gross_income != 0)
+
+    return {
+        "effective tax": effective(taxes),
+        "effective tax after loan": effective(taxes_after_loan),
+        "net income": gross_income - taxes,
+        "net income after loan": gross_income - taxes_after_loan,
+    }
+
+
+def gross_from_net(
+    net_income: np.ndarray, plan: str = None, year: int = None
+) -> np.ndarray:
+    """
+    Calculates the gross income required for a net income.
+
+    Net income is the gross income minus income tax and national insurance (and the student loan
+    repayments, if `plan` is given). This is piecewise-linear and strictly increasing, so it is
+    inverted exactly by looking up the segment that each net income falls in.
+
+    Parameters:
+    net_income (np.ndarray): The net income to be calculated for.
+    plan (str, optional): The student loan repayment plan. Defaults to None, for no student loan.
+    year (int, optional): The tax year whose rules are used, see `utils.rules.get_tax_year`. Defaults to the current tax year.
+
+    Returns:
+    np.ndarray: The gross income.
+    """
+    rules = get_tax_year(year)
+    taxes = rules.taxes_schedule
+    if plan:
+        taxes = taxes + rules.student_loan_schedule(plan)
+    net = Schedule(taxes.breakpoints, 1 - taxes.rates, -taxes.intercepts)
+    return net.inverse()(net_income)
+
+
+def marginal_rate(
+    gross_income: np.ndarray, plan: str = None, year: int = None
+) -> np.ndarray:
+    """
+    Calculates the combined marginal rate of income tax and national insurance (and the student
+    loan repayments, if `plan` is given).
+
+    The rate is read from the same compiled schedules as `income_tax`, so it includes the 60%
+    income tax rate while the personal allowance is being reduced. At a threshold, the rate
+    above the threshold is returned.
+
+    Parameters:
+    gross_income (np.ndarray): The gross income on which the marginal rate is to be calculated.
+    plan (str, optional): The student loan repayment plan. Defaults to None, for no student loan.
+    year (int, optional): The tax year whose rules are used, see `utils.rules.get_tax_year`. Defaults to the current tax year.
+
+    Returns:
+    np.ndarray: The marginal rate.
+    """
+    rules = get_tax_year(year)
+    taxes = rules.taxes_schedule
+    if plan:
+        taxes = taxes + rules.student_loan_schedule(plan)
+    return taxes.marginal_rate(gross_income)
 
 
 def monthly(
-    func: callable, gross_income_monthly: np.ndarray, *args: list
+    func: callable,
+    gross_income_monthly: np.ndarray,
+    *args: list,
+    out: np.ndarray = None,
+    **kwargs: dict,
 ) -> np.ndarray:
     """
     Calculates the monthly tax based on the gross income and the given function.
@@ -81,11 +208,88 @@ def monthly(
     func (callable): The function to be applied on the gross income.
     gross_income_monthly (np.ndarray): The gross income on a monthly basis.
     *args (list): Additional arguments to be passed to the function.
+    out (np.ndarray, optional): The array to write the monthly tax into, in which case `func` must accept `out` and allow it to be its input. Defaults to None.
+    **kwargs (dict): Additional keyword arguments, such as `workspace`, to be passed to the function.
 
     Returns:
     np.ndarray: The calculated monthly tax.
     """
-    return func(gross_income_monthly * 12, *args) / 12
+    if out is None:
+        return func(gross_income_monthly * 12, *args, **kwargs) / 12
+    np.multiply(gross_income_monthly, 12, out=out)
+    func(out, *args, out=out, **kwargs)
+    out /= 12
+    return out
+
+
+# Number of elements in each shard evaluated by `parallel`, small enough to stay in the CPU cache
+SHARD_SIZE = 1 << 16
+
+# The workspace of each thread used by `parallel`
+_thread_local = threading.local()
+
+
+@cache
+def _executor(workers: int) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tax")
+
+
+def parallel(
+    func: callable,
+    gross_income: np.ndarray,
+    *args: list,
+    workers: int = None,
+    shard_size: int = SHARD_SIZE,
+    out: np.ndarray = None,
+    **kwargs: dict,
+) -> np.ndarray:
+    """
+    Evaluates a tax function on multiple cores.
+
+    The gross income is split into shards that are evaluated on a pool of threads, each of which
+    writes into its part of `out` using its own workspace. NumPy releases the GIL while it
+    computes, so the shards are evaluated in parallel.
+
+    Parameters:
+    func (callable): The function to be applied on the gross income, which must accept `out` and `workspace`, e.g. `income_tax`.
+    gross_income (np.ndarray): The gross income.
+    *args (list): Additional arguments to be passed to the function, which must not be per element arrays.
+    workers (int, optional): The number of threads to use. Defaults to None, for the number of CPUs.
+    shard_size (int, optional): The number of elements in each shard. Defaults to `SHARD_SIZE`.
+    out (np.ndarray, optional): A contiguous array of the same shape as `gross_income` to write the result into. Defaults to None.
+    **kwargs (dict): Additional keyword arguments to be passed to the function.
+
+    Returns:
+    np.ndarray: The calculated tax.
+
+    Raises:
+    ValueError: If `out` is not a C-contiguous array of the same shape as `gross_income`, since the
+        shards could not be written into it in place.
+    """
+    gross_income = np.asarray(gross_income, dtype=float)
+    if out is None:
+        out = np.empty_like(gross_income)
+    elif out.shape != gross_income.shape or not out.flags.c_contiguous:
+        raise ValueError(
+            "`out` must be a C-contiguous array of the same shape as `gross_income`"
+        )
+    gross_income_flat, out_flat = gross_income.reshape(-1), out.reshape(-1)
+
+    def evaluate(start: int):
+        if not hasattr(_thread_local, "workspace"):
+            _thread_local.workspace = Workspace()
+        shard = slice(start, start + shard_size)
+        func(
+            gross_income_flat[shard],
+            *args,
+            out=out_flat[shard],
+            workspace=_thread_local.workspace,
+            **kwargs,
+        )
+
+    executor = _executor(workers or os.cpu_count())
+    list(executor.map(evaluate, range(0, len(out_flat), shard_size)))
+    return out
 
 
 def net_present_value(cash_flow: np.ndarray, discount_rate: float = 0.05) -> np.ndarray:
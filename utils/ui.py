@@ -1,8 +1,14 @@
+import asyncio
 import inspect
 import os
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import date
+from functools import partial
 
 import ipywidgets as widgets
+import numpy as np
 import plotly.graph_objects as go
 from ipywidgets import Widget
 from plotly.subplots import make_subplots
@@ -120,13 +126,189 @@ def observe_children(widget: widgets.Widget, callback: callable) -> None:
             child.observe(callback, names="value")
 
 
+# Default maximum number of points sent to the browser for each trace
+MAX_POINTS = 2000
+
+
+def decimate(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Chooses the points of a line to keep, so that it has at most about `max_points` but looks the same.
+
+    The line is split into buckets of equal numbers of points, and the minimum, the maximum and the
+    sharpest kink (the largest absolute second difference) of each bucket are kept, along with the
+    first and last points. Peaks and kinks, such as those at tax thresholds, are therefore kept.
+
+    Args:
+        y (np.ndarray): The y values of the line, whose x values are assumed to be evenly spaced.
+        max_points (int): The maximum number of points to keep, excluding the first and last.
+
+    Returns:
+        np.ndarray: The sorted indices of the points to keep.
+    """
+    y = np.asarray(y, dtype=float)
+    num_points = len(y)
+    if num_points <= max_points:
+        return np.arange(num_points)
+    num_buckets = max(max_points // 3, 1)
+    bucket_size = -(-num_points // num_buckets)
+    padding = num_buckets * bucket_size - num_points
+
+    kink = np.zeros(num_points)
+    kink[1:-1] = np.abs(np.diff(y, 2))
+    buckets = np.pad(y, (0, padding), mode="edge").reshape(num_buckets, -1)
+    kinks = np.pad(kink, (0, padding)).reshape(num_buckets, -1)
+    start = np.arange(num_buckets) * bucket_size
+    indices = np.concatenate(
+        (
+            [0, num_points - 1],
+            start + buckets.argmin(axis=1),
+            start + buckets.argmax(axis=1),
+            start + kinks.argmax(axis=1),
+        )
+    )
+    return np.unique(np.minimum(indices, num_points - 1))
+
+
+class TraceBinding:
+    """
+    Declares once which arrays of the data feed which traces of a figure.
+
+    The first call adds the traces to the figure, later calls assign the new arrays straight into
+    the `x` and `y` of the existing traces inside one `batch_update`, so no figure is rebuilt.
+
+    Traces longer than `max_points` are reduced with `decimate` to the points that are visible on
+    their x-axis, so zooming in (see `InteractiveFigure`) and plotting again refines them.
+    """
+
+    def __init__(
+        self, x: str | Callable, traces: list[dict], max_points: int = MAX_POINTS
+    ):
+        """
+        Args:
+            x (str | Callable): The key of the x values of every trace in the data, or a function that gets them from the data. They must be in ascending order.
+            traces (list[dict]): The kwargs of each `go.Scatter` trace, where "y" is instead the key or function of its y values. "row" and "col" are the subplot that it is added to, defaulting to 1.
+            max_points (int, optional): The maximum number of points of each trace sent to the figure. Defaults to `MAX_POINTS`, None sends every point.
+        """
+        self.x = x
+        self.traces = traces
+        self.max_points = max_points
+
+    @staticmethod
+    def get(data, key: str | Callable):
+        """
+        Gets an array from the data.
+
+        Args:
+            data: The data, e.g. a dict, DataFrame or `RepaymentResult`.
+            key (str | Callable): The key of the array in the data, or a function that gets it from the data.
+        """
+        return key(data) if callable(key) else data[key]
+
+    def visible(
+        self, fig: go.Figure, axis: str, x: np.ndarray, y: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Reduces a trace to at most `max_points` of the points visible on its x-axis.
+
+        Args:
+            fig (go.Figure): The figure that the trace is on.
+            axis (str): The x-axis of the trace, e.g. "x" or "x2".
+            x (np.ndarray): The x values of the trace.
+            y (np.ndarray): The y values of the trace.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The x and y values of the points to plot.
+        """
+        if self.max_points is None or len(x) <= self.max_points:
+            return x, y
+        # Only the points in the zoomed range, and one either side of it, are visible
+        start, stop = 0, len(x)
+        layout_axis = fig.layout[f"xaxis{axis[1:]}"]
+        if layout_axis.autorange is False and layout_axis.range:
+            if x.dtype.kind == "M":
+                low, high = (
+                    np.datetime64(str(r).replace(" ", "T")) for r in layout_axis.range
+                )
+            else:
+                low, high = map(float, layout_axis.range)
+            start = max(np.searchsorted(x, low) - 1, 0)
+            stop = min(np.searchsorted(x, high, side="right") + 1, len(x))
+        index = start + decimate(y[start:stop], self.max_points)
+        return x[index], y[index]
+
+    def __call__(self, fig: go.Figure, data) -> None:
+        """
+        Plots the data on the traces of the figure, adding them if they do not exist yet.
+
+        Args:
+            fig (go.Figure): The figure, or figure widget, to plot on.
+            data: The data to get the arrays of the traces from.
+        """
+        x = np.asarray(self.get(data, self.x))
+        with fig.batch_update():
+            if len(fig.data) != len(self.traces):
+                for trace in self.traces:
+                    kwargs = {k: v for k, v in trace.items() if k not in ("row", "col")}
+                    y = np.asarray(self.get(data, trace["y"]))
+                    kwargs["x"], kwargs["y"] = self.visible(fig, "x", x, y)
+                    fig.add_trace(
+                        go.Scatter(mode="lines", **kwargs),
+                        row=trace.get("row", 1),
+                        col=trace.get("col", 1),
+                    )
+            else:
+                for old_trace, trace in zip(fig.data, self.traces):
+                    y = np.asarray(self.get(data, trace["y"]))
+                    old_trace.x, old_trace.y = self.visible(fig, old_trace.xaxis, x, y)
+
+
 class InteractiveFigure:
-    def __init__(self, plot: callable, update: callable, x_title=None, y_title=None):
+    def __init__(
+        self,
+        plot: callable,
+        update: callable,
+        x_title=None,
+        y_title=None,
+        debounce: float = 0.1,
+        background: bool = False,
+        refine_on_zoom: bool = True,
+    ):
+        """
+        Args:
+            plot (callable): The function that plots the data on the figure, whose parameters after the figure and data are inputs.
+            update (callable): The function that processes the data, whose parameters are inputs.
+            x_title (str, optional): The title of the x-axis. Defaults to None.
+            y_title (str, optional): The title of the y-axis. Defaults to None.
+            debounce (float, optional): The number of seconds to wait for further changes before recomputing, so that a burst of changes is recomputed once. Defaults to 0.1, 0 recomputes on every change.
+            background (bool, optional): Whether to run `update` on a worker thread, so that the widgets stay responsive while it runs. Results of inputs that have since changed are discarded. Defaults to False.
+            refine_on_zoom (bool, optional): Whether to plot again when an x-axis is zoomed, so that traces reduced by a `TraceBinding` are refined to the visible range. Defaults to True.
+        """
         self.update = update
         self.plot = plot
+        self.debounce = debounce
+        self.background = background
         self.process_kwargs = list(inspect.signature(self.update).parameters.keys())
         self.plot_kwargs = list(inspect.signature(self.plot).parameters.keys())
 
+        # The last data and the kwargs it was processed with, so that changes to inputs that
+        # only affect the plot do not re-process the data
+        self.data = None
+        self.data_kwargs = None
+
+        # The recompute scheduled by the last change, and whether changes are being held
+        self._scheduled = None
+        self._held = 0
+        self._stale = False
+
+        # The worker that runs `update` in the background, the task waiting for it, the kwargs
+        # that the task processes and plots with and the number of recomputes started, so that
+        # results of older recomputes can be discarded
+        self._worker = ThreadPoolExecutor(max_workers=1) if background else None
+        self._task = None
+        self._task_kwargs = None
+        self._task_plot_kwargs = None
+        self._generation = 0
+
         # Create inputs
         kwargs = self.process_kwargs + self.plot_kwargs
         self.inputs = Inputs().get_widgets(kwargs)
@@ -145,23 +327,142 @@ class InteractiveFigure:
         )
 
         # Initialise the figure
-        self.on_change()
+        self.recompute()
 
         # Create the inputs and figure widgets
         self.inputs_widget = widgets.VBox(tuple(self.inputs.values()))
         self.figure_widget = go.FigureWidget(self.figure)
         # Add callback when change in value is observed for any of the inputs
         observe_children(widget=self.inputs_widget, callback=self.on_change)
+        # Add callback when the range of any of the x-axes changes
+        self.zoomed = False
+        if refine_on_zoom:
+            xaxes = [k for k in self.figure_widget.layout if k.startswith("xaxis")]
+            self.figure_widget.layout.on_change(
+                self.on_zoom, *(f"{axis}.range" for axis in xaxes)
+            )
 
         # Package the inputs and the figure into the app
         self.app = widgets.VBox((self.inputs_widget, self.figure_widget))
 
-    # Callback that re-runs the data processing medhot and updates plots
-    def on_change(self, *args):
+    # Callback that schedules a recompute when any of the inputs change
+    def on_change(self, change: dict = None):
+        """
+        Schedules a recompute after `debounce` seconds, replacing any already scheduled, so that a
+        burst of changes only recomputes the final state once.
+
+        Changes are recomputed immediately if `debounce` is 0 or there is no running event loop,
+        e.g. outside of Jupyter.
+
+        Args:
+            change (dict, optional): The change event of the widget that changed. Defaults to None.
+        """
+        if self._held:
+            self._stale = True
+            return
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if self.debounce <= 0 or loop is None:
+            self.recompute()
+        else:
+            self._scheduled = loop.call_later(self.debounce, self.recompute)
+
+    def on_zoom(self, layout: go.Layout, *ranges):
+        """
+        Schedules a plot when the user zooms an x-axis in or out, but not when plotly changes the
+        range to fit new data.
+
+        Args:
+            layout (go.Layout): The layout of the figure widget.
+            *ranges: The new range of each x-axis.
+        """
+        xaxes = [k for k in layout if k.startswith("xaxis")]
+        zoomed = any(layout[axis].autorange is False for axis in xaxes)
+        if zoomed or self.zoomed:
+            self.zoomed = zoomed
+            self.on_change()
+
+    @contextmanager
+    def hold(self):
+        """
+        Holds every change made inside the context, then recomputes once at the end if there were
+        any, e.g. when setting several inputs programmatically.
+        """
+        self._held += 1
+        try:
+            yield
+        finally:
+            self._held -= 1
+            if not self._held and self._stale:
+                self._stale = False
+                self.on_change()
+
+    def recompute(self):
+        """
+        Re-runs the stages whose inputs have changed.
+
+        The data is only re-processed if the kwargs of `update` differ from those of the last
+        data, e.g. when the widget that changed only feeds `plot`, the last data is plotted again.
+        If `update` is already running in the background with the same kwargs, it is left to
+        finish and plots with the latest kwargs of `plot`.
+        """
+        self._scheduled = None
         # Extract kwargs from widgets
         kwargs = {k: v.value for k, v in self.inputs.items()}
         process_kwargs = {k: kwargs[k] for k in self.process_kwargs if k in kwargs}
         plot_kwargs = {k: kwargs[k] for k in self.plot_kwargs if k in kwargs}
-        # Update and plot the new data
-        data = self.update(**process_kwargs)
-        self.plot(getattr(self, "figure_widget", self.figure), data, **plot_kwargs)
+        running = self._task is not None and not self._task.done()
+        if running and process_kwargs == self._task_kwargs:
+            self._task_plot_kwargs = plot_kwargs
+            return
+        self._generation += 1
+        # A newer recompute makes any still in progress stale
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Update the data if its inputs changed and plot it
+        if process_kwargs != self.data_kwargs:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if self._worker is not None and loop is not None:
+                self._task_kwargs = process_kwargs
+                self._task_plot_kwargs = plot_kwargs
+                self._task = loop.create_task(self._update_in_background())
+                return
+            self.data = self.update(**process_kwargs)
+            self.data_kwargs = process_kwargs
+        self.plot(getattr(self, "figure_widget", self.figure), self.data, **plot_kwargs)
+
+    async def _update_in_background(self):
+        """
+        Runs `update` on the worker thread, then plots its result unless it has become stale.
+
+        The kwargs are read from `_task_kwargs` when the task starts and from `_task_plot_kwargs`
+        when it finishes, so that changes to the plot made in the meantime are plotted. The
+        figure is only ever plotted on the event loop's thread. Cancelling the task while
+        `update` is queued stops it from running, while one that is already running finishes
+        and its result is discarded.
+        """
+        generation = self._generation
+        process_kwargs = self._task_kwargs
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            self._worker, partial(self.update, **process_kwargs)
+        )
+        if generation != self._generation:
+            return
+        self._task = None
+        self.data = data
+        self.data_kwargs = process_kwargs
+        self.plot(
+            getattr(self, "figure_widget", self.figure),
+            self.data,
+            **self._task_plot_kwargs,
+        )